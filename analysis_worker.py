@@ -0,0 +1,115 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+""" Audio analysis in a separate, long-lived process.
+The worker imports essentia once at start-up, so requests pay no import latency, and the live process never
+loads it (estimate_notes imports it lazily). Audio goes through a shared-memory float32 buffer and only a small
+job description through the queue; a crash of the worker is detected and the worker restarted, without taking
+the MIDI/OSC path down with it. """
+
+max_seconds = 60  # longest audio the shared buffer holds, at 44.1 kHz
+buffer_rate = 44100
+poll_interval = 0.1  # seconds between liveness checks while waiting for a result
+
+
+def worker_loop(buffer_name, buffer_size, jobs, results):
+    """ Worker process: warm up essentia, then analyze jobs until None arrives """
+    import estimate_notes  # imported here, so the parent does not need essentia
+    estimate_notes.essentia_standard()
+    buffer = shared_memory.SharedMemory(name=buffer_name)
+    samples = np.ndarray((buffer_size,), dtype=np.float32, buffer=buffer.buf)
+    results.put(("ready", None))
+    try:
+        while (job := jobs.get()) is not None:
+            job_id, source, length, sample_rate, profile, gate = job
+            try:
+                if source is None:  # audio in the shared buffer
+                    audio = estimate_notes.prepare_audio(samples[:length], sample_rate, profile)
+                else:  # file path
+                    audio = estimate_notes.load_audio(source, profile)
+                notes = estimate_notes.estimate_notes_from_audio(audio, profile, gate)
+                results.put((job_id, sorted(notes)))
+            except Exception as e:
+                results.put((job_id, e))
+    finally:
+        del samples
+        buffer.close()
+
+
+class AnalysisWorker:
+    def __init__(self, max_seconds=max_seconds):
+        """ Start the worker process with a shared buffer of max_seconds of audio at 44.1 kHz """
+        self.buffer_size = int(max_seconds * buffer_rate)
+        self.buffer = shared_memory.SharedMemory(create=True, size=self.buffer_size * 4)
+        self.samples = np.ndarray((self.buffer_size,), dtype=np.float32, buffer=self.buffer.buf)
+        self.context = multiprocessing.get_context("spawn")  # a clean process, nothing inherited from the server
+        self.lock = threading.RLock()  # one job at a time: the buffer is shared
+        self.job_ids = itertools.count()
+        self.process = None
+        self.start()
+
+    def start(self, timeout=60.0):
+        """ (Re)start the worker process and wait until essentia is loaded """
+        self.jobs, self.results = self.context.Queue(), self.context.Queue()
+        self.process = self.context.Process(target=worker_loop, args=(self.buffer.name, self.buffer_size, self.jobs, self.results),
+                                            daemon=True)
+        self.process.start()
+        start = time.perf_counter()
+        self.wait_for("ready", timeout)
+        print(f"Analysis worker ready (pid {self.process.pid}, {time.perf_counter() - start:.1f} s start-up)")
+
+    def wait_for(self, job_id, timeout=None):
+        """ Result of a job; restarts the worker and raises RuntimeError if it died or timed out """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            try:
+                result_id, result = self.results.get(timeout=poll_interval)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    reason = f"Analysis worker died (exit code {self.process.exitcode})"
+                elif deadline is not None and time.perf_counter() > deadline:
+                    reason = "Analysis worker timed out"
+                    self.process.kill()
+                else:
+                    continue
+                if job_id != "ready":
+                    self.start()
+                raise RuntimeError(reason)
+            if result_id != job_id:
+                continue  # late result of a job that timed out before
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+    def submit(self, source, length, sample_rate, profile, gate, timeout):
+        with self.lock:
+            job_id = next(self.job_ids)
+            self.jobs.put((job_id, source, length, sample_rate, profile, gate))
+            return set(self.wait_for(job_id, timeout))
+
+    def analyze(self, audio, sample_rate=buffer_rate, profile="full", gate=True, timeout=None):
+        """ Set of MIDI notes in a mono audio array (as estimate_notes.estimate_notes_from_audio) """
+        audio = np.asarray(audio, dtype=np.float32)
+        if len(audio) > self.buffer_size:
+            raise ValueError(f"Audio longer than the {self.buffer_size / buffer_rate:.0f} s analysis buffer")
+        with self.lock:  # the buffer must not change while the worker reads it
+            self.samples[:len(audio)] = audio
+            return self.submit(None, len(audio), sample_rate, profile, gate, timeout)
+
+    def analyze_file(self, audiofile, profile="full", gate=True, timeout=None):
+        """ Set of MIDI notes in an audio file, loaded by the worker (as estimate_notes.estimate_pitch_melodia) """
+        return self.submit(audiofile, 0, buffer_rate, profile, gate, timeout)
+
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            self.jobs.put(None)
+            self.process.join(timeout=5)
+        del self.samples
+        self.buffer.close()
+        self.buffer.unlink()
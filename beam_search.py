@@ -0,0 +1,118 @@
+from collections import Counter
+
+import numpy as np
+
+from markov_sequence_generator import find_start_state, get_lower_order_state
+
+""" Constrained beam search over the Markov transition model: instead of resampling generate_new_sequence()
+until a sequence fits, search for the most likely sequences that satisfy the constraints directly. """
+
+unseen_log_prob = np.log(1e-6)  # log-probability of a forced chord the model never saw in that context
+
+
+def successor_log_probs(transition_states, state, cache):
+    """ --- Successors of a state with their log-probabilities from the transition counts ---
+    Parameters:
+        transition_states (dict): the Markov model
+        state (tuple): current state (last m_order chords)
+        cache (dict): per-search cache, as backing off to a lower order is expensive
+    Returns:
+        chords (list[tuple]), log_probs (np.ndarray), notes (np.ndarray): successor chords padded with inf
+    """
+    if state not in cache:
+        if state in transition_states:
+            successors = transition_states[state]
+        else:
+            successors = get_lower_order_state(transition_states, list(state))
+        counts = Counter(successors)
+        chords = list(counts)
+        log_probs = np.log(np.array(list(counts.values()), dtype=float) / len(successors))
+        cache[state] = (chords, log_probs, pad_chords(chords))
+    return cache[state]
+
+
+def pad_chords(chords):
+    """ Stack chords of different sizes into one float array, padded with inf """
+    notes = np.full((len(chords), max(len(chord) for chord in chords)), np.inf)
+    for i, chord in enumerate(chords):
+        notes[i, :len(chord)] = chord
+    return notes
+
+
+def voice_leading_cost(prev_chord, candidates):
+    """ --- Vectorized voice-leading cost from one chord to many candidates ---
+    Sum of the distances (in semitones) from every candidate note to the nearest note of the previous chord
+    and from every previous note to the nearest candidate note.
+    Parameters:
+        prev_chord (tuple): previous chord
+        candidates (np.ndarray): candidate chords from pad_chords(), shape (n, max_notes)
+    Returns:
+        cost (np.ndarray): shape (n,)
+    """
+    distances = np.abs(candidates[:, :, None] - np.asarray(prev_chord, dtype=float)[None, None, :])
+    to_prev = distances.min(axis=2)
+    to_prev = np.where(np.isfinite(to_prev), to_prev, 0).sum(axis=1)
+    from_prev = distances.min(axis=1).sum(axis=1)
+    return to_prev + from_prev
+
+
+def beam_search(start=None, transition_states=None, size=8, beam_width=8, constraints=None, final_chord=None,
+                voice_leading_weight=0.1, max_expansions=20000, n_best=1, rng=None, deadline=None):
+    """ --- Generate the most likely sequences under hard constraints ---
+    Score of a sequence: sum of transition log-probabilities minus voice_leading_weight * voice-leading cost.
+    Parameters:
+        start (list[tuple]): starting chord(s), as for generate_new_sequence
+        transition_states (dict): the Markov model
+        size (int): length of sequence to generate (including the start state)
+        beam_width (int): number of partial sequences kept per step
+        constraints (dict): {position: chord} chords fixed at positions of the output sequence
+            (positions inside the start state cannot be constrained, except when size <= m_order: the start
+            state is then truncated to size and the constrained chords are put in place)
+        final_chord (tuple): chord the sequence must end on (same as constraints[size - 1])
+        voice_leading_weight (float): weight of the voice-leading cost against the log-probabilities
+        max_expansions (int): compute budget in scored candidates; once spent, beams are completed greedily
+        n_best (int): number of sequences to return
+        rng (np.random.Generator): random stream for picking the start state (None: fresh entropy)
+        deadline (Deadline): once it passed, the best beams so far are completed greedily (deadline.hit is set)
+    Returns:
+        best (list[tuple[list[list], float]]): up to n_best (sequence, score), best first
+    """
+    constraints = {pos: tuple(chord) for pos, chord in (constraints or {}).items()}
+    if final_chord is not None:
+        constraints[size - 1] = tuple(final_chord)
+
+    start_tuple = find_start_state(start, transition_states, rng=rng)
+    m_order = len(start_tuple)
+    if size <= m_order:  # nothing to search, the start state already fills the sequence
+        sequence = [constraints.get(pos, chord) for pos, chord in enumerate(start_tuple[:size])]
+        return [([list(chord) for chord in sequence], 0.0)]
+    beams = [(0.0, tuple(start_tuple))]
+    cache = {}
+    expansions = 0
+
+    for position in range(m_order, size):
+        if expansions >= max_expansions or (deadline is not None and deadline.expired()):
+            width = 1  # budget or time spent: greedy completion of the best beam
+        else:
+            width = beam_width
+        scores, sequences = [], []
+        for score, sequence in beams:
+            chords, log_probs, notes = successor_log_probs(transition_states, sequence[-m_order:], cache)
+            if position in constraints:
+                fixed = constraints[position]
+                log_probs = np.array([log_probs[chords.index(fixed)] if fixed in chords else unseen_log_prob])
+                chords, notes = [fixed], pad_chords([fixed])
+            step_scores = score + log_probs
+            if voice_leading_weight:
+                step_scores = step_scores - voice_leading_weight * voice_leading_cost(sequence[-1], notes)
+            scores.append(step_scores)
+            sequences.extend(sequence + (chord,) for chord in chords)
+            expansions += len(chords)
+
+        scores = np.concatenate(scores)
+        keep = min(width, len(scores))
+        best = np.argpartition(-scores, keep - 1)[:keep]
+        beams = [(scores[i], sequences[i]) for i in best]
+
+    beams.sort(key=lambda beam: -beam[0])
+    return [([list(chord) for chord in sequence], float(score)) for score, sequence in beams[:n_best]]
@@ -0,0 +1,163 @@
+import os
+import pickle
+import time
+
+import numpy as np
+
+from estimate_notes import (ChordIndex, analysis_profiles, estimate_notes_from_audio, get_chord_from_notes,
+                            get_closest_chord, load_audio, prepare_audio)
+
+""" Accuracy versus speed of the Melodia analysis profiles in estimate_notes.analysis_profiles.
+Synthesized melodies (arpeggiated vocabulary chords with harmonic tones) have known notes, so every profile is
+scored on note precision/recall and on whether the estimated notes still map to the same closest chord.
+The files in data/wav have no ground truth; there the profiles are compared with the "full" profile. """
+
+synth_rate = 44100  # sample rate of the synthesized test audio
+
+
+def synthesize_melody(notes, note_duration=0.4, sample_rate=synth_rate, rng=None):
+    """ --- Mono test audio: one harmonic tone per MIDI note, one after the other ---
+    Parameters:
+        notes (list[int]): MIDI notes in playing order
+        note_duration (float): seconds per note
+        rng (np.random.Generator): random stream for the background noise
+    Returns:
+        audio (np.ndarray): float32 samples in [-1, 1]
+    """
+    rng = np.random.default_rng(rng)
+    t = np.arange(int(note_duration * sample_rate)) / sample_rate
+    envelope = np.minimum(t / 0.01, 1.0) * np.exp(-3.0 * t)  # 10 ms attack, exponential decay
+    tones = []
+    for note in notes:
+        frequency = 440.0 * 2 ** ((note - 69) / 12)
+        harmonics = np.arange(1, 6)
+        harmonics = harmonics[harmonics * frequency < sample_rate / 2]
+        tone = (np.sin(2 * np.pi * frequency * harmonics[:, None] * t) / harmonics[:, None]).sum(axis=0)
+        tones.append(envelope * tone)
+    audio = np.concatenate(tones)
+    audio = 0.5 * audio / np.abs(audio).max() + 0.005 * rng.standard_normal(len(audio))
+    return audio.astype(np.float32)
+
+
+def test_melodies(unique_midi_chords, n_cases=20, rng=None):
+    """ Arpeggios of random vocabulary chords (notes 48-84), each note played twice in random order """
+    rng = np.random.default_rng(rng)
+    chords = [chord for chord in unique_midi_chords if 3 <= len(chord) and 48 <= min(chord) and max(chord) <= 84]
+    cases = []
+    for i in rng.choice(len(chords), size=min(n_cases, len(chords)), replace=False):
+        notes = list(chords[i]) * 2
+        rng.shuffle(notes)
+        cases.append((sorted(set(chords[i])), synthesize_melody(notes, rng=rng)))
+    return cases
+
+
+def note_scores(estimated, truth):
+    """ Precision, recall and F1 of an estimated note set against the true notes """
+    estimated = {int(round(note)) for note in estimated}
+    correct = len(estimated & set(truth))
+    precision = correct / len(estimated) if estimated else 0.0
+    recall = correct / len(truth) if truth else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if correct else 0.0
+    return precision, recall, f1
+
+
+def closest_chord(notes, unique_midi_chords):
+    if not notes:
+        return None
+    input_chord, chord_length = get_chord_from_notes({int(round(note)) for note in notes})
+    return get_closest_chord(input_chord, unique_midi_chords, chord_length, weight=100.0)[0]
+
+
+def chord_agreement(chord_pairs):
+    """ --- Chord accuracy of (estimated, reference) closest-chord pairs ---
+    A silent reference (None) has no chord to get right, so it is scored separately instead of counting
+    as a correct chord whenever the estimate is silent too.
+    Returns:
+        chord_accuracy (float): share of the references with a chord that the estimate matches (nan: none)
+        silence_accuracy (float): share of the silent references whose estimate is silent too (nan: none)
+    """
+    voiced = [estimated == reference for estimated, reference in chord_pairs if reference is not None]
+    silent = [estimated is None for estimated, reference in chord_pairs if reference is None]
+    return (float(np.mean(voiced)) if voiced else float('nan'),
+            float(np.mean(silent)) if silent else float('nan'))
+
+
+def benchmark_synthesized(cases, unique_midi_chords, profiles):
+    """ --- Score every profile on the synthesized cases ---
+    Returns:
+        results (dict): profile -> {'precision', 'recall', 'f1', 'chord_accuracy', 'silence_accuracy', 'realtime_factor'}
+        (realtime_factor: analysis seconds per second of audio, including resampling; see chord_agreement())
+    """
+    audio_seconds = sum(len(audio) for _, audio in cases) / synth_rate
+    results = {}
+    for profile in profiles:
+        scores, chord_pairs, elapsed = [], [], 0.0
+        for truth, audio in cases:
+            start = time.perf_counter()
+            notes = estimate_notes_from_audio(prepare_audio(audio, synth_rate, profile), profile)
+            elapsed += time.perf_counter() - start
+            scores.append(note_scores(notes, truth))
+            chord_pairs.append((closest_chord(notes, unique_midi_chords), closest_chord(truth, unique_midi_chords)))
+        precision, recall, f1 = np.mean(scores, axis=0)
+        chord_accuracy, silence_accuracy = chord_agreement(chord_pairs)
+        results[profile] = dict(precision=precision, recall=recall, f1=f1, chord_accuracy=chord_accuracy,
+                                silence_accuracy=silence_accuracy, realtime_factor=elapsed / audio_seconds)
+    return results
+
+
+def benchmark_files(audio_files, unique_midi_chords, profiles):
+    """ Agreement of every profile with the "full" profile on real recordings: mean note F1 and same closest chord
+    (over the files where "full" found notes), and how often it stays silent where "full" does """
+    reference = {}
+    results = {}
+    for profile in profiles:
+        f1s, chord_pairs, elapsed = [], [], 0.0
+        for audio_file in audio_files:
+            start = time.perf_counter()
+            notes = estimate_notes_from_audio(load_audio(audio_file, profile), profile)
+            elapsed += time.perf_counter() - start
+            if profile == "full":
+                reference[audio_file] = notes
+            truth = sorted({int(round(note)) for note in reference[audio_file]})
+            if truth:
+                f1s.append(note_scores(notes, truth)[2])
+            chord_pairs.append((closest_chord(notes, unique_midi_chords), closest_chord(truth, unique_midi_chords)))
+        chord_accuracy, silence_accuracy = chord_agreement(chord_pairs)
+        results[profile] = dict(f1=float(np.mean(f1s)) if f1s else float('nan'), chord_accuracy=chord_accuracy,
+                                silence_accuracy=silence_accuracy, seconds=elapsed)
+    return results
+
+
+def main():
+    """ Print the accuracy/speed table of all profiles and the cheapest one that keeps the chords of "full" """
+
+    # Settings
+    n_cases = 20
+    wav_path = "data/wav"
+    tolerance = 0.05  # accepted loss of chord accuracy against "full"
+
+    with open("unique_midi_chords.pkl", "rb") as f:
+        unique_midi_chords = ChordIndex(pickle.load(f))
+    profiles = ["full"] + [profile for profile in analysis_profiles if profile != "full"]  # "full" is the reference
+
+    print(f"### Synthesized melodies ({n_cases})")
+    results = benchmark_synthesized(test_melodies(unique_midi_chords, n_cases, rng=0), unique_midi_chords, profiles)
+    for profile, r in results.items():
+        print(f"{profile:>9}: precision {r['precision']:.2f}, recall {r['recall']:.2f}, F1 {r['f1']:.2f}, "
+              f"chord accuracy {r['chord_accuracy']:.0%}, {r['realtime_factor']:.3f} s per audio second")
+
+    audio_files = sorted(os.path.join(wav_path, file) for file in os.listdir(wav_path) if file.endswith(".wav"))
+    if audio_files:
+        print(f"### {wav_path} ({len(audio_files)} files, agreement with 'full')")
+        for profile, r in benchmark_files(audio_files, unique_midi_chords, profiles).items():
+            print(f"{profile:>9}: F1 {r['f1']:.2f}, same chord {r['chord_accuracy']:.0%}, "
+                  f"silent where 'full' is {r['silence_accuracy']:.0%}, {r['seconds']:.2f} s")
+
+    accurate = [profile for profile in profiles
+                if results[profile]['chord_accuracy'] >= results["full"]['chord_accuracy'] - tolerance]
+    cheapest = min(accurate, key=lambda profile: results[profile]['realtime_factor'])
+    print(f"Cheapest profile within {tolerance:.0%} chord accuracy of 'full': {cheapest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -83,7 +83,7 @@ def classify(data, labels):
 
 
 
-def plot(knn, X, y, labels):
+def plot(knn, X, y, labels, rng=None):
     # Reduce dimensionality to 2D using PCA
     print("PCA dimensionality reduction")
     pca = PCA(n_components=2)
@@ -125,7 +125,7 @@ def plot(knn, X, y, labels):
 
     # Select a subset of data points to plot
     subset_size = len(X_reduced)  # len(X_reduced), or any other int
-    indices = np.random.choice(range(X_reduced.shape[0]), size=subset_size, replace=False)
+    indices = np.random.default_rng(rng).choice(X_reduced.shape[0], size=subset_size, replace=False)
     X = X_reduced[indices]
     y = y[indices]
 
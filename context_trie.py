@@ -0,0 +1,135 @@
+import numpy as np
+
+""" PPM-style context trie over chord ids for the Markov model.
+The trie is a suffix trie: from the root, the first edge is the most recent chord of a context, the next edge
+the chord before it, and so on. Every node holds the successor counts of all contexts ending with its suffix,
+so the deepest node reached for the current state is the longest-suffix match (the same statistics
+get_lower_order_state() recomputes on every miss), and its depth-1 node indexes every context ending
+with a given chord. """
+
+
+class TrieNode:
+    __slots__ = ('children', 'counts', 'successor_ids', 'cumulative_counts', 'contexts', 'is_context')
+
+    def __init__(self):
+        self.children = {}  # chord id -> TrieNode (one chord further back in time)
+        self.counts = {}  # successor chord id -> count (until finalize())
+        self.successor_ids = None  # np.ndarray of successor ids (after finalize())
+        self.cumulative_counts = None  # np.ndarray of cumulative counts, for sampling by binary search
+        self.contexts = []  # depth-1 nodes: indices into ContextTrie.contexts ending with this chord
+        self.is_context = False  # a full-order context of the model ends here
+
+    def sample(self, rng):
+        """ Draw a successor id proportionally to its count """
+        r = rng.integers(self.cumulative_counts[-1])
+        return int(self.successor_ids[np.searchsorted(self.cumulative_counts, r, side='right')])
+
+
+class ContextTrie:
+    def __init__(self, m_order):
+        self.m_order = m_order
+        self.chords = []  # chord id -> chord tuple
+        self.ch2i = {}  # chord tuple -> chord id
+        self.root = TrieNode()
+        self.contexts = []  # all full-order contexts as tuples of chord ids, for uniform random selection
+
+    def chord_id(self, chord):
+        """ Id of a chord, added to the vocabulary if new """
+        chord = tuple(chord)
+        if chord not in self.ch2i:
+            self.ch2i[chord] = len(self.chords)
+            self.chords.append(chord)
+        return self.ch2i[chord]
+
+    def add(self, context, successors):
+        """ Add one context (sequence of chords, oldest first) and its successor chords (with repetition) """
+        context_ids = [self.chord_id(chord) for chord in context]
+        successor_ids = [self.chord_id(chord) for chord in successors]
+        node = self.root
+        for depth, chord_id in enumerate([None] + context_ids[::-1]):
+            if chord_id is not None:
+                node = node.children.setdefault(chord_id, TrieNode())
+            for successor_id in successor_ids:
+                node.counts[successor_id] = node.counts.get(successor_id, 0) + 1
+            if depth == 1:
+                node.contexts.append(len(self.contexts))
+        node.is_context = True
+        self.contexts.append(tuple(context_ids))
+
+    def finalize(self):
+        """ Convert the successor counts of every node into sorted arrays for sampling """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            node.successor_ids = np.fromiter(node.counts, dtype=np.int32, count=len(node.counts))
+            node.cumulative_counts = np.cumsum(np.fromiter(node.counts.values(), dtype=np.int64, count=len(node.counts)))
+            node.counts = None
+            stack.extend(node.children.values())
+        return self
+
+    @classmethod
+    def from_transition_chain(cls, transition_states):
+        """ Build the trie from the dict returned by compute_transition_chain """
+        trie = cls(len(next(iter(transition_states))))
+        for context, successors in transition_states.items():
+            trie.add(context, successors)
+        return trie.finalize()
+
+    def longest_suffix(self, context_ids):
+        """ Deepest node matching the most recent chords of context_ids, and its depth (0: no chord matched) """
+        node, depth = self.root, 0
+        for chord_id in reversed(context_ids):
+            child = node.children.get(chord_id)
+            if child is None:
+                break
+            node, depth = child, depth + 1
+        return node, depth
+
+    def random_context(self, rng):
+        """ A full-order context chosen uniformly at random """
+        return list(self.contexts[rng.integers(len(self.contexts))])
+
+    def find_start_state(self, start, rng):
+        """ Trie equivalent of markov_sequence_generator.find_start_state(), on chord ids """
+        if not start:
+            return self.random_context(rng)
+        if isinstance(start[0], int):
+            start = [start]
+        start_ids = [self.ch2i.get(tuple(chord)) for chord in start]
+        if None in start_ids:
+            start_ids = [self.ch2i.get(tuple(start[0]))]
+            if None in start_ids:
+                return self.random_context(rng)
+
+        # exact start sequence
+        node, depth = self.longest_suffix(start_ids)
+        if depth == len(start_ids) == self.m_order and node.is_context:
+            return start_ids
+
+        # a context ending with the first chord
+        node = self.root.children.get(start_ids[0])  # None for a chord only ever seen as a successor
+        if node is not None and node.contexts:
+            return list(self.contexts[node.contexts[rng.integers(len(node.contexts))]])
+        return self.random_context(rng)
+
+    def generate(self, start=None, size=100, rng=None, deadline=None):
+        """ --- Generate a new sequence, as markov_sequence_generator.generate_new_sequence() ---
+        Parameters:
+            start (list[tuple]): starting chord(s), or None for a random context
+            size (int): length of sequence to generate
+            rng (np.random.Generator | int | np.random.SeedSequence): random stream or seed
+            deadline (Deadline): once it passed, sampling stops and the last chord is held up to size (deadline.hit is set)
+        Returns:
+            new_sequence (list[list]): generated note sequence
+        """
+        rng = np.random.default_rng(rng)
+        new_ids = self.find_start_state(start, rng)
+        while len(new_ids) < size:
+            if deadline is not None and deadline.expired():
+                new_ids += [new_ids[-1]] * (size - len(new_ids))  # out of time: hold the last chord
+                break
+            node, _ = self.longest_suffix(new_ids[-self.m_order:])
+            if not len(node.successor_ids):
+                break
+            new_ids.append(node.sample(rng))
+        return [list(self.chords[chord_id]) for chord_id in new_ids]
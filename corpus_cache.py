@@ -0,0 +1,88 @@
+import os
+
+import jams
+import numpy as np
+
+""" One-time compile of the JAMS chord annotations into a columnar .npz cache, so training, evaluation
+and VAE runs read the whole corpus with bulk I/O instead of re-parsing every JAMS document """
+
+cache_path = "data/chord_corpus.npz"
+cache_version = 2  # bumped when the compiled content changes (2: chord-namespace annotation), older caches recompile
+
+
+def jams_files(data_path="data/jams"):
+    """ Sorted JAMS file names with their modification times (ns) and sizes, to tell when the cache is stale """
+    files = sorted(file for file in os.listdir(data_path) if file.endswith(".jams"))
+    stats = [os.stat(os.path.join(data_path, file)) for file in files]
+    return (files, np.array([stat.st_mtime_ns for stat in stats], dtype=np.int64),
+            np.array([stat.st_size for stat in stats], dtype=np.int64))
+
+
+def compile_corpus(data_path="data/jams", cache_path=cache_path):
+    """ --- Extract song ids, times and chord labels of all JAMS files into one columnar cache ---
+    Reads the first chord-namespace annotation of every file (as vae.load_choco_jams() does; the first annotation
+    if there is none) and keeps the observations with a string label.
+    Columns:
+        files (str): file name of every song
+        file_mtimes, file_sizes (int64): modification time (ns) and size of every file when it was compiled
+        song_offsets (int64): chords of song i are [song_offsets[i], song_offsets[i + 1])
+        times, durations (float64): onset and duration of every chord in seconds
+        label_ids (int32): chord label id of every chord, into labels
+        labels (str): chord label vocabulary
+        version (int): cache_version it was compiled with
+    """
+    files, file_mtimes, file_sizes = jams_files(data_path)
+    song_offsets = [0]
+    times, durations, chord_labels = [], [], []
+    for file in files:
+        audio_jams = jams.load(os.path.join(data_path, file), validate=False)
+        chord_annotations = audio_jams.annotations.search(namespace="chord")
+        annotation = chord_annotations[0] if len(chord_annotations) else audio_jams.annotations[0]
+        for observation in annotation['data']:
+            if isinstance(observation.value, str):
+                times.append(observation.time)
+                durations.append(observation.duration)
+                chord_labels.append(observation.value)
+        song_offsets.append(len(chord_labels))
+
+    labels, label_ids = np.unique(np.array(chord_labels, dtype=str), return_inverse=True)
+    np.savez(cache_path,
+             files=np.array(files, dtype=str),
+             file_mtimes=file_mtimes,
+             file_sizes=file_sizes,
+             song_offsets=np.array(song_offsets, dtype=np.int64),
+             times=np.array(times, dtype=np.float64),
+             durations=np.array(durations, dtype=np.float64),
+             label_ids=label_ids.astype(np.int32),
+             labels=labels,
+             version=np.array(cache_version))
+    print(f"Compiled {len(files)} songs, {len(chord_labels)} chords to {cache_path}")
+
+
+def load_corpus(data_path="data/jams", cache_path=cache_path):
+    """ Load the columnar cache as a dict of arrays, compiling it first if it is missing or the files changed
+    (added, removed or edited: names, modification times and sizes are compared) """
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            corpus = dict(data)
+        if not os.path.isdir(data_path):
+            return corpus  # only the cache was shipped
+        files, file_mtimes, file_sizes = jams_files(data_path)
+        if (corpus.get('version', 1) == cache_version and files == corpus['files'].tolist()
+                and np.array_equal(file_mtimes, corpus['file_mtimes']) and np.array_equal(file_sizes, corpus['file_sizes'])):
+            return corpus
+        print(f"{cache_path} is out of date (JAMS files in {data_path} changed or older cache format), recompiling")
+    compile_corpus(data_path, cache_path)
+    return load_corpus(data_path, cache_path)
+
+
+def load_progressions(data_path="data/jams", cache_path=cache_path) -> list[list[str]]:
+    """ Chord labels of every song from the cache (same result as get_progressions() on all files) """
+    corpus = load_corpus(data_path, cache_path)
+    labels = corpus['labels'][corpus['label_ids']].tolist()
+    offsets = corpus['song_offsets'].tolist()
+    return [labels[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+if __name__ == "__main__":
+    compile_corpus()
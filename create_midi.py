@@ -1,8 +1,8 @@
-from music21 import stream, chord, meter
+from music21 import stream, chord, meter, midi
 
 
-def create_midi_file(new_sequence_midi: list[list[int]], chord_duration: float = 2, file_name='midi') -> None:
-    """ Create MIDI File from List of MIDI Notes """
+def create_score(new_sequence_midi: list[list[int]], chord_duration: float = 2) -> stream.Score:
+    """ Create a music21 Score with one chord part from List of MIDI Notes """
     score = stream.Score()  # create a music21 score
     time_signature = meter.TimeSignature('4/4')  # define a 4/4 time signature
     score.append(time_signature)
@@ -15,6 +15,12 @@ def create_midi_file(new_sequence_midi: list[list[int]], chord_duration: float =
         m21_chord.duration.quarterLength = chord_duration
         chord_part.append(m21_chord)  # Add the chord to the part
     score.append(chord_part)  # Add the chord part to the score
+    return score
+
+
+def create_midi_file(new_sequence_midi: list[list[int]], chord_duration: float = 2, file_name='midi') -> None:
+    """ Create MIDI File from List of MIDI Notes """
+    score = create_score(new_sequence_midi, chord_duration)
 
     # Save the score to a MIDI file
     midi_file_path = f"{file_name}_new.mid"
@@ -24,3 +30,9 @@ def create_midi_file(new_sequence_midi: list[list[int]], chord_duration: float =
         print(f"Error saving MIDI file: {e}")
         return
     print(f"MIDI file saved to {midi_file_path}.")
+
+
+def create_midi_bytes(new_sequence_midi: list[list[int]], chord_duration: float = 2) -> bytes:
+    """ Standard MIDI File content of a List of MIDI Notes, without touching the disk """
+    score = create_score(new_sequence_midi, chord_duration)
+    return midi.translate.streamToMidiFile(score).writestr()
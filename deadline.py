@@ -0,0 +1,58 @@
+import threading
+import time
+
+""" Deadlines for anytime generation: at the loop boundary a late answer is worse than a slightly worse one,
+so generation checks the deadline of its request and returns the best result found so far once it passed.
+deadline_stats counts how often requests ran into their deadline. """
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        """ Deadline seconds from now on the monotonic clock (None: no deadline) """
+        self.at = None if seconds is None else time.perf_counter() + seconds
+        self.hit = False  # set once expired() returned True: the result was cut short
+
+    @classmethod
+    def at_time(cls, timestamp):
+        """ Deadline at a time.perf_counter() timestamp, e.g. the next downbeat from midi_clock.ClockFollower.time_of_beat() """
+        deadline = cls()
+        deadline.at = timestamp
+        return deadline
+
+    def remaining(self):
+        return float('inf') if self.at is None else self.at - time.perf_counter()
+
+    def expired(self):
+        if self.at is not None and time.perf_counter() >= self.at:
+            self.hit = True
+        return self.hit
+
+
+class DeadlineStats:
+    """ Thread-safe count of requests that met or hit their deadline """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.met = 0
+        self.hit = 0
+
+    def record(self, deadline):
+        """ Count a request when its result is delivered: a hit if the deadline passed by then """
+        deadline.expired()  # late answers count even if nothing checked the deadline after it passed
+        with self.lock:
+            if deadline.hit:
+                self.hit += 1
+            else:
+                self.met += 1
+
+    def hit_rate(self):
+        with self.lock:
+            total = self.met + self.hit
+            return self.hit / total if total else 0.0
+
+    def __str__(self):
+        with self.lock:
+            return f"deadlines hit: {self.hit}/{self.met + self.hit}"
+
+
+deadline_stats = DeadlineStats()
@@ -1,37 +1,213 @@
 import numpy as np
-import essentia.standard as es
 import pickle
 import pretty_midi as pm
+from functools import lru_cache
+
+
+es = None  # essentia.standard: slow to import and only needed for audio input, see essentia_standard()
+
+
+def essentia_standard():
+    """ Import essentia on first use (the live process only needs it for audio, see analysis_worker.py) """
+    global es
+    if es is None:
+        import essentia.standard
+        es = essentia.standard
+    return es
 
 
 def transpose_notes(notes, octave=0):
-    """ Transpose Notes to an Octave Above 60, and keeps it below 73.
-    NOTE: param: octave: what is this good for? """
-    if min(notes) > 72:
-        notes = [int(note)-12 for note in notes if note > 72]
-    
-    if min(notes) >= 60:
-        return notes
-    notes = [int(note)+12 for note in notes]
-    octave += 1
-    
-    return transpose_notes(notes, octave)
+    """ Transpose Notes by whole octaves so that the lowest note lies between 60 and 72.
+    NOTE: param: octave: what is this good for? (unused, kept for compatibility) """
+    notes = np.fromiter(notes, dtype=np.int64)
+    lowest = notes.min()
+    if lowest < 60:
+        notes += 12 * ((60 - lowest + 11) // 12)
+    elif lowest > 72:
+        notes -= 12 * ((lowest - 72 + 11) // 12)
+    return notes.tolist()
+
+
+def pitch_class_mask(notes):
+    """ 12-bit pitch-class set of a chord: bit p is set if any note has pitch class p """
+    mask = 0
+    for note in notes:
+        mask |= 1 << (int(note) % 12)
+    return mask
+
+
+def rotate_mask(mask, semitones):
+    """ Pitch-class mask transposed down by semitones """
+    semitones %= 12
+    return ((mask >> semitones) | (mask << (12 - semitones))) & 0xFFF
+
 
+def normalized_mask(mask):
+    """ Transposition-normalized mask (smallest of the 12 rotations) and the rotation that produces it """
+    return min((rotate_mask(mask, r), r) for r in range(12))
 
-def estimate_pitch_melodia(audiofile):
-    """ Estimate Pitches from Audio File """
-    loader = es.EqloudLoader(filename=audiofile, sampleRate=44100)
-    audio = loader()
 
-    pitch_extractor = es.PredominantPitchMelodia(frameSize=2048, hopSize=128)
-    pitch_values, _ = pitch_extractor(audio)
-    onsets, durations, notes = es.PitchContourSegmentation(hopSize=128)(pitch_values, audio)
+class ChordIndex:
+    """ --- Index of the chord vocabulary for fast closest-chord lookup ---
+    Chords are indexed by their notes, by their pitch-class mask and by their transposition-normalized mask,
+    so exact and transposed matches are hash lookups; only a miss falls back to the (vectorized) distance search.
+    Repeated inputs are served from an LRU cache. Iterates like the set of chords it was built from.
+    """
 
-    return set(notes)
+    def __init__(self, unique_midi_chords):
+        self.chords = [tuple(chord) for chord in unique_midi_chords]
+        self.by_notes = {}  # sorted notes -> chords
+        self.by_mask = {}  # (pitch-class mask, length) -> chords
+        self.by_shape = {}  # (normalized mask, length) -> chords
+        self.by_length = {}  # length -> (chords, notes array) for the distance search
+        for chord in self.chords:
+            mask = pitch_class_mask(chord)
+            self.by_notes.setdefault(tuple(sorted(chord)), []).append(chord)
+            self.by_mask.setdefault((mask, len(chord)), []).append(chord)
+            self.by_shape.setdefault((normalized_mask(mask)[0], len(chord)), []).append(chord)
+        for length in {len(chord) for chord in self.chords}:
+            chords = [chord for chord in self.chords if len(chord) == length]
+            self.by_length[length] = (chords, np.array(chords, dtype=float))
+        self.lookup = lru_cache(maxsize=1024)(self._lookup)
+
+    def __iter__(self):
+        return iter(self.chords)
+
+    def __reduce__(self):
+        return ChordIndex, (self.chords,)  # rebuilt on unpickling (the lru_cache wrapper does not pickle)
+
+    def __len__(self):
+        return len(self.chords)
+
+    def _lookup(self, input_chord, chord_length, weight):
+        mask = pitch_class_mask(input_chord)
+        candidates = (self.by_notes.get(tuple(sorted(input_chord)))
+                      or self.by_mask.get((mask, chord_length))
+                      or self.by_shape.get((normalized_mask(mask)[0], chord_length)))
+        if candidates:
+            chords, notes = candidates, np.array(candidates, dtype=float)
+        elif chord_length in self.by_length:
+            chords, notes = self.by_length[chord_length]
+        else:
+            return None, np.inf
+        distances = get_weighted_distances(input_chord, notes, weight)
+        best = int(np.argmin(distances))
+        return chords[best], float(distances[best])
+
+
+# Melodia analysis settings, from the most accurate to the cheapest (see benchmark_melodia.py);
+# frame_size keeps the analysis window at ~46 ms across sample rates
+analysis_profiles = {
+    "full": dict(sample_rate=44100, frame_size=2048, hop_size=128),  # original settings
+    "balanced": dict(sample_rate=22050, frame_size=1024, hop_size=128),
+    "fast": dict(sample_rate=22050, frame_size=1024, hop_size=256),
+    "coarse": dict(sample_rate=22050, frame_size=1024, hop_size=512),
+}
+
+
+def load_audio(audiofile, profile="full"):
+    """ Load an audio file as mono, equal-loudness filtered float32 array at the sample rate of the profile """
+    return essentia_standard().EqloudLoader(filename=audiofile, sampleRate=analysis_profiles[profile]["sample_rate"])()
+
+
+def prepare_audio(audio, sample_rate, profile="full"):
+    """ Resample a mono array to the sample rate of the profile and apply the equal-loudness filter (as load_audio) """
+    es = essentia_standard()
+    target_rate = analysis_profiles[profile]["sample_rate"]
+    audio = np.asarray(audio, dtype=np.float32)
+    if sample_rate != target_rate:
+        audio = es.Resample(inputSampleRate=sample_rate, outputSampleRate=target_rate)(audio)
+    return es.EqualLoudness(sampleRate=target_rate)(audio)
+
+
+def active_regions(audio, sample_rate, threshold_db=-40.0, silence_db=-60.0, frame_size=1024, hop_size=512,
+                   min_gap=0.25, padding=0.05):
+    """ --- Sounding regions of an audio array from its RMS envelope ---
+    Parameters:
+        audio (np.ndarray): mono audio
+        sample_rate (int): sample rate of audio
+        threshold_db (float): frames more than this below the loudest frame count as silent
+        silence_db (float): frames below this level (dBFS) count as silent regardless of the loudest frame
+        frame_size, hop_size (int): RMS frames in samples
+        min_gap (float): silent gaps shorter than this (seconds) do not split a region
+        padding (float): seconds added before and after every region, as context for the pitch tracker
+    Returns:
+        regions (list[tuple[int, int]]): (start, end) sample indices of the active regions, in order
+    """
+    audio = np.asarray(audio, dtype=np.float64)
+    if len(audio) <= frame_size:
+        return [(0, len(audio))] if np.any(audio) else []
+
+    # RMS of all frames at once from the cumulative energy
+    energy = np.concatenate([[0.0], np.cumsum(audio ** 2)])
+    starts = np.arange(0, len(audio) - frame_size + 1, hop_size)
+    rms = np.sqrt(np.maximum(energy[starts + frame_size] - energy[starts], 0.0) / frame_size)
+    level_db = 20 * np.log10(np.maximum(rms, 1e-12))
+    active = (level_db > level_db.max() + threshold_db) & (level_db > silence_db)
+    if not active.any():
+        return []
+
+    # runs of active frames, padded, and merged across short gaps
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    run_starts = np.maximum(starts[np.flatnonzero(edges == 1)] - int(padding * sample_rate), 0)
+    run_ends = np.minimum(starts[np.flatnonzero(edges == -1) - 1] + frame_size + int(padding * sample_rate), len(audio))
+    new_region = np.concatenate([[True], run_starts[1:] - run_ends[:-1] > min_gap * sample_rate])
+    region_starts = run_starts[new_region]
+    region_ends = np.append(run_ends[np.flatnonzero(new_region)[1:] - 1], run_ends[-1])
+    return list(zip(region_starts.tolist(), region_ends.tolist()))
+
+
+def estimate_note_events(audio, profile="full", gate=True):
+    """ --- Estimate the notes in audio prepared by load_audio() or prepare_audio() ---
+    Parameters:
+        audio (np.ndarray): mono float32 audio at the sample rate of the profile
+        profile (str): key of analysis_profiles
+        gate (bool): run the pitch tracker only on the active_regions(), so silence and decays cost nothing
+    Returns:
+        onsets, durations (np.ndarray): seconds on the timeline of the whole audio
+        notes (np.ndarray): MIDI note of every segmented note
+    """
+    es = essentia_standard()
+    settings = analysis_profiles[profile]
+    sample_rate = settings["sample_rate"]
+    pitch_extractor = es.PredominantPitchMelodia(frameSize=settings["frame_size"], hopSize=settings["hop_size"],
+                                                 sampleRate=sample_rate)
+    segmentation = es.PitchContourSegmentation(hopSize=settings["hop_size"], sampleRate=sample_rate)
+
+    regions = active_regions(audio, sample_rate, frame_size=settings["frame_size"]) if gate else [(0, len(audio))]
+    if not regions:
+        return np.empty(0), np.empty(0), np.empty(0)
+    all_onsets, all_durations, all_notes = [], [], []
+    for start, end in regions:
+        segment = np.ascontiguousarray(audio[start:end], dtype=np.float32)
+        pitch_values, _ = pitch_extractor(segment)
+        onsets, durations, notes = segmentation(pitch_values, segment)
+        all_onsets.append(np.asarray(onsets) + start / sample_rate)  # back to the original timeline
+        all_durations.append(np.asarray(durations))
+        all_notes.append(np.asarray(notes))
+    return np.concatenate(all_onsets), np.concatenate(all_durations), np.concatenate(all_notes)
+
+
+def estimate_notes_from_audio(audio, profile="full", gate=True):
+    """ Set of notes estimated in audio prepared by load_audio() or prepare_audio(), see estimate_note_events() """
+    onsets, durations, notes = estimate_note_events(audio, profile, gate)
+    return set(notes.tolist())
+
+
+def estimate_pitch_melodia(audiofile, profile="full", gate=True):
+    """ Estimate Pitches from Audio File (profile: key of analysis_profiles, "full" is the most accurate;
+    gate: analyze only the sounding regions) """
+    return estimate_notes_from_audio(load_audio(audiofile, profile), profile, gate)
 
 
 def get_chord_from_notes(all_notes):
-    """ Get Chord from a SET of notes """
+    """ Get Chord from a SET of notes (repeated sets are served from an LRU cache) """
+    input_chord, chord_length = chord_from_note_set(frozenset(int(note) for note in all_notes))
+    return list(input_chord), chord_length
+
+
+@lru_cache(maxsize=1024)
+def chord_from_note_set(all_notes):
     # Transpose Notes so that Lowest Note is above 60
     all_notes_transposed = sorted(transpose_notes(all_notes))
     print(f'All present notes transposed: {all_notes_transposed}')
@@ -50,7 +226,7 @@ def get_chord_from_notes(all_notes):
         input_chord = all_notes_transposed
         chord_length = len(input_chord)
 
-    return input_chord, chord_length
+    return tuple(input_chord), chord_length
 
 
 def get_weighted_distance(chord1, chord2, weight):
@@ -63,27 +239,26 @@ def get_weighted_distance(chord1, chord2, weight):
     return np.sqrt(weighted_diff + regular_diff)
 
 
+def get_weighted_distances(chord, chords, weight):
+    """ get_weighted_distance() from one chord to every row of an (n, chord_length) array """
+    chord = np.asarray(chord, dtype=float)
+    weighted_diff = (((chords[:, :2] - chord[:2]) * weight) ** 2).sum(axis=1)
+    regular_diff = ((chords[:, 2:] - chord[2:]) ** 2).sum(axis=1)
+    return np.sqrt(weighted_diff + regular_diff)
+
+
 def get_closest_chord(input_chord, unique_midi_chords, chord_length, weight=10.0):
     """ --- Get closest chord from a list of unique chords, with a higher weighting on the first element ---
+    Chords with the same notes, then the same pitch classes, then the same pitch classes transposed are
+    looked up in a ChordIndex first; only if none exists all chords of the same length are compared.
+    Pass a ChordIndex (see load_data in markov_main.py) instead of the set of chords to avoid rebuilding it.
     # NOTE: some separate ideas here
     # a) consider using cosine similarity in get_weighted_distance()
     # b) consider returning all chords with a distance below a certain threshold to pick from the closest ones
     """
-
-    # Get chords with the same length
-    chords_same_length = [ch for ch in unique_midi_chords if len(ch) == chord_length]
-
-    # Find closest chord to input
-    min_distance = np.inf
-    closest_chord = None
-    for chord in chords_same_length:
-        distance = get_weighted_distance(input_chord, chord, weight)
-        print(f"Comparing input chord {input_chord} with chord {chord} -- distance: {distance}")
-        if distance < min_distance:
-            min_distance = distance
-            closest_chord = chord
-
-    return closest_chord, min_distance
+    if not isinstance(unique_midi_chords, ChordIndex):
+        unique_midi_chords = ChordIndex(unique_midi_chords)
+    return unique_midi_chords.lookup(tuple(int(note) for note in input_chord), chord_length, weight)
 
 
 def get_notes_from_MIDI(midi_file):
@@ -1,33 +1,71 @@
 import pickle
 import os
 
-from estimate_notes import estimate_pitch_melodia, get_chord_from_notes, get_closest_chord, get_notes_from_MIDI
-from markov_sequence_generator import generate_new_sequence
+from estimate_notes import ChordIndex, estimate_pitch_melodia, get_chord_from_notes, get_closest_chord, get_notes_from_MIDI
+from markov_sequence_generator import generate_new_sequence, generate_new_relative_sequence
 from create_midi import create_midi_file
+from beam_search import beam_search
+from voicing import optimize_voicings
+from context_trie import ContextTrie
+from deadline import deadline_stats
+from shared_model import MappedModel, model_path
 
 """ Runs pitch estimation from audio, chord sequence generation and MIDI file creation """
 
+# Settings (shared with resident processes such as osc_server.py, which load the data once)
+relative = False  # True: use the transposition-invariant model
+beam = False  # True: beam search for the most likely sequence ending on the input chord (absolute model, not with relative)
+trie = not beam  # resident processes store the model as a context trie (beam search needs the dict model)
+analysis_profile = "full"  # Melodia settings for audio input, see estimate_notes.analysis_profiles and benchmark_melodia.py
+deadline_profile = "fast"  # Melodia settings for audio input of requests with a deadline (the analysis cannot be cut short)
 
-def load_data():
-    """ Loads and returns:
-        a) the list of unique MIDI chords
-        b) the pre-computed transition matrix for chord sequences """
 
-    with open("unique_midi_chords.pkl", "rb") as f:
-        unique_midi_chords = pickle.load(f)
+def model_files(relative=False, sketch=False, mapped=False):
+    """ Files load_data() reads for these options (e.g. to watch them for changes) """
+    if mapped:
+        model_file = os.path.join(model_path, "meta.npy")  # replaced last by shared_model.export_model()
+    elif sketch:
+        model_file = "sketch_model.pkl"
+    elif relative:
+        model_file = "relative_transition_matrix.pkl"
+    else:
+        model_file = "transition_matrix.pkl"
+    return ["unique_midi_chords.pkl", model_file]
+
 
-    with open("transition_matrix.pkl", "rb") as f:
+def load_data(relative=False, trie=False, sketch=False, mapped=False):
+    """ Loads and returns:
+        a) the list of unique MIDI chords, as a ChordIndex for fast closest-chord lookup
+        b) the pre-computed transition matrix for chord sequences
+           (the transposition-invariant one if relative; as a ContextTrie if trie;
+           the approximate high-order SketchTransitionModel from sketch_model.py if sketch;
+           the memory-mapped MappedModel exported by shared_model.py if mapped) """
+
+    chords_file, model_file = model_files(relative=relative, sketch=sketch, mapped=mapped)
+    with open(chords_file, "rb") as f:
+        unique_midi_chords = ChordIndex(pickle.load(f))
+
+    if mapped:
+        return unique_midi_chords, MappedModel(model_path)
+    with open(model_file, "rb") as f:
         transition_matrix = pickle.load(f)
 
-    return unique_midi_chords, transition_matrix
+    if trie and not (relative or sketch):
+        transition_matrix = ContextTrie.from_transition_chain(transition_matrix)
 
+    return unique_midi_chords, transition_matrix
 
-def main_process(unique_midi_chords, transition_matrix, file_name, input_type):
-    print(f"Processing {file_name}")
 
+def analyze_input(unique_midi_chords, file_name, input_type, analyzer=None, deadline=None):
+    """ Closest known chord to the notes of an audio or MIDI file, and the length of the sequence to generate
+    analyzer: AnalysisWorker to run the audio analysis in (see analysis_worker.py), None: in this process
+    deadline: Deadline of the request; audio is then analyzed with the cheaper deadline_profile """
     # Get chord from [input_type] ##### this is where we should get audio input from MAX via OSC
-    if "audio" in input_type:
-        all_notes = estimate_pitch_melodia(file_name)  # estimate active notes
+    profile = analysis_profile if deadline is None else deadline_profile
+    if "audio" in input_type and analyzer is not None:
+        all_notes = analyzer.analyze_file(file_name, profile=profile)  # estimate active notes in the worker
+    elif "audio" in input_type:
+        all_notes = estimate_pitch_melodia(file_name, profile=profile)  # estimate active notes
     elif "midi" in input_type:
         all_notes = get_notes_from_MIDI(file_name)  # read active notes from MIDI file
     input_chord, chord_length = get_chord_from_notes(all_notes)
@@ -37,21 +75,73 @@ def main_process(unique_midi_chords, transition_matrix, file_name, input_type):
     print(f"Input chord: {input_chord}, chord length: {chord_length}\nMost similar chord: {closest_chord}, distance: {distance}")
 
     # Settings for new sequence
-    chord_duration = 2  # beats
     out_size = 8
     out_size = chord_length * 2  # e.g. if 2 input chords, create 4 output chords
     # but chord_length is not number of chords, just number of notes in chord
     # in sequence generation, this number is used to count the tuples (which are chords)
     # OR: if 2 bars input, create 4 bars output
+    return closest_chord, out_size
+
+
+def generate_sequence(transition_matrix, closest_chord, out_size, relative=False, beam=False, revoice=True, rng=None,
+                      deadline=None):
+    """ New chord sequence of out_size chords starting from closest_chord
+    deadline: Deadline of the request; once it passed, the beam search completes its best beams greedily, the
+    sampling generators (trie, dict, sketch, mapped) hold the last chord up to out_size and the revoicing is skipped
+    Raises ValueError for beam with relative: the beam search takes absolute chords as start and final chord, which a
+    model of relative tokens does not contain """
+    if beam and relative:
+        raise ValueError("beam=True needs the absolute model, it cannot be combined with relative=True")
+    if beam:
+        # most likely sequence that returns to the input chord, with smooth voice leading
+        (new_sequence, _), = beam_search(closest_chord, transition_matrix, size=out_size, final_chord=closest_chord,
+                                         rng=rng, deadline=deadline)
+    elif not isinstance(transition_matrix, dict):  # ContextTrie, SketchTransitionModel or MappedModel
+        new_sequence = transition_matrix.generate(closest_chord, size=out_size, rng=rng, deadline=deadline)
+    elif relative:
+        new_sequence = generate_new_relative_sequence(closest_chord, transition_matrix, size=out_size, rng=rng,
+                                                      deadline=deadline)
+    else:
+        new_sequence = generate_new_sequence(closest_chord, transition_matrix, size=out_size, rng=rng, deadline=deadline)
+    if revoice and not (deadline is not None and deadline.expired()):
+        new_sequence = optimize_voicings(new_sequence)  # smooth voice leading across the sequence
+    return new_sequence
+
+
+def main_process(unique_midi_chords, transition_matrix, file_name, input_type, relative=False, beam=False, revoice=True, rng=None,
+                 write_file=True, cache=None, deadline=None, analyzer=None):
+    """ cache: PregenCache of ready sequences per (closest chord, length), None: generate now
+    deadline: Deadline of the request (e.g. the next downbeat), see generate_sequence(); recorded in
+    deadline.deadline_stats when the sequence is ready, before the MIDI file is written
+    analyzer: AnalysisWorker for audio input, see analyze_input() """
+    print(f"Processing {file_name}")
+    chord_duration = 2  # beats
+    closest_chord, out_size = analyze_input(unique_midi_chords, file_name, input_type, analyzer=analyzer, deadline=deadline)
 
     # Generate New Sequence
-    new_sequence = generate_new_sequence(closest_chord, transition_matrix, size=out_size)
-    create_midi_file(new_sequence, chord_duration=chord_duration, file_name=file_name)
+    if cache is not None:
+        new_sequence = cache.get((tuple(closest_chord), out_size), rng=rng, deadline=deadline)
+    else:
+        new_sequence = generate_sequence(transition_matrix, closest_chord, out_size, relative=relative, beam=beam,
+                                         revoice=revoice, rng=rng, deadline=deadline)
+    if deadline is not None:
+        deadline_stats.record(deadline)
+        if deadline.hit:
+            print(f"Deadline hit, returning the best sequence so far ({deadline_stats})")
+    if write_file:
+        create_midi_file(new_sequence, chord_duration=chord_duration, file_name=file_name)
     return new_sequence
 
 
-def main():
-    unique_midi_chords, transition_matrix = load_data()
+def main(rng=None, data=None, write_file=True, cache=None, deadline=None, analyzer=None):
+    """ rng: numpy Generator, seed or SeedSequence for this run (e.g. a logged request seed, to replay it)
+    data: (unique_midi_chords, transition_matrix) already loaded by a resident process, None: load_data() without the
+          trie, whose build costs more than the one sequence a single run samples from the dict model
+    write_file: write the sequence to a MIDI file (off when the caller sends it on, e.g. as an OSC reply)
+    cache: PregenCache to serve the sequence from (see pregen_cache.py)
+    deadline: Deadline by which the sequence is needed (see deadline.py)
+    analyzer: AnalysisWorker for audio input (see analysis_worker.py) """
+    unique_midi_chords, transition_matrix = data or load_data(relative=relative)
 
     ### SELECT BLOCK ###
 
@@ -69,7 +159,9 @@ def main():
     input_type = "midi"
     print("### Reading notes from MIDI")
     file_name = "data/midi/c_e_fsharp.mid"
-    new_chord_sequence = main_process(unique_midi_chords, transition_matrix, file_name, input_type)
+    new_chord_sequence = main_process(unique_midi_chords, transition_matrix, file_name, input_type, relative=relative, beam=beam, rng=rng,
+                                      write_file=write_file, cache=cache, deadline=deadline,
+                                      analyzer=analyzer)
 
     print(f"new_chord_sequence: {new_chord_sequence}")
     return new_chord_sequence
@@ -5,6 +5,7 @@ import numpy as np
 import random
 
 from chord_to_midi import chord_to_midi
+from corpus_cache import load_progressions
 
 
 def load_file_list(path):
@@ -53,6 +54,205 @@ def compute_transition_chain(sequence, m_order=2):
     return transition_states
 
 
+root_support = {0: 10, 7: 5, 4: 3, 10: 2, 2: 1}  # support of a pitch class for the root below it, by interval (Parncutt)
+
+
+def chord_root(chord):
+    """ Estimated root note of a chord: the note whose pitch class gets the most support from the chord's
+    pitch-class set (weights in root_support); ties go to the lower note, so ambiguous chords keep their bass """
+    pitch_classes = {note % 12 for note in chord}
+    return max(sorted(chord), key=lambda note: sum(root_support.get((pc - note) % 12, 0) for pc in pitch_classes))
+
+
+def to_relative_sequence(sequence):
+    """ --- Convert absolute chords to transposition-invariant tokens ---
+    Each chord is anchored on its estimated root (see chord_root()). A token is (step, shape):
+        step: interval between this root and the previous chord's root, mod 12 (0 for the first chord)
+        shape: the chord's notes relative to its root, i.e. the chord quality/voicing (inversions have notes below 0)
+    Example:
+        [(60, 64, 67), (65, 69, 72), (62, 67, 71)] -> [(0, (0, 4, 7)), (5, (0, 4, 7)), (2, (-5, 0, 4))]
+    """
+    tokens = []
+    prev_anchor = None
+    for chord in sequence:
+        anchor = chord_root(chord)
+        step = 0 if prev_anchor is None else (anchor - prev_anchor) % 12
+        tokens.append((step, tuple(note - anchor for note in chord)))
+        prev_anchor = anchor
+    return tokens
+
+
+def relative_to_absolute(tokens, ref_index=0, ref_anchor=60):
+    """ --- Re-anchor relative tokens to absolute chords ---
+    The chord at ref_index is anchored on ref_anchor (e.g. the root of the input chord, see chord_root());
+    all other anchors take the shortest way around the circle from there, so the sequence stays in the input's register.
+    """
+    steps = np.array([step for step, _ in tokens])
+    steps[0] = 0
+    cumulative = np.cumsum(steps)
+    anchors = ref_anchor + (cumulative - cumulative[ref_index] + 6) % 12 - 6
+    return [[int(anchor + note) for note in shape] for anchor, (_, shape) in zip(anchors, tokens)]
+
+
+def compute_relative_transition_chain(sequence, m_order=2):
+    """ --- Compute Transposition-Invariant Transition Chain ---
+    Like compute_transition_chain, but keyed on relative tokens (see to_relative_sequence), so the
+    same progression in 12 keys shares one context. The step of the first token in a key is set to 0,
+    as it only depends on the chord before the context.
+    Parameters:
+        sequence (np.ndarray): Sequence of absolute chords
+        m_order (int): Order for Markov Chain
+    Returns:
+        transition_states (dict): Transition States over (step, shape) tokens
+    """
+    transition_states = {}
+    tokens = to_relative_sequence(sequence)
+
+    for i in range(m_order, len(tokens)):
+        prev_states = ((0, tokens[i - m_order][1]),) + tuple(tokens[i - m_order + 1:i])
+        if prev_states not in transition_states:
+            transition_states[prev_states] = [tokens[i]]
+        else:
+            transition_states[prev_states].append(tokens[i])
+
+    return transition_states
+
+
+def generate_new_relative_sequence(start=None, transition_states=None, size=100, rng=None, deadline=None):
+    """
+    Generate a new sequence from a transposition-invariant model, re-anchored to the key of the start chord(s).
+    Parameters:
+        start (list[tuple]): starting sequence of absolute chords (e.g. [(60, 64, 67), (62, 65, 69)])
+        transition_states (dict): the relative Markov model from compute_relative_transition_chain
+        size (int): length of sequence to generate
+        rng (np.random.Generator | int | np.random.SeedSequence): random stream or seed (None: fresh entropy)
+        deadline (Deadline): once it passed, sampling stops and the last chord is held up to size
+    Returns:
+        new_sequence (list[list]): generated note sequence
+    """
+    rng = np.random.default_rng(rng)
+    ref_index, ref_anchor = 0, 60
+    exact = False
+    if not start:
+        start_tuple = list(transition_states)[rng.integers(len(transition_states))]
+    else:
+        if isinstance(start[0], int):
+            start = [start]
+        start_tokens = to_relative_sequence(start)
+        start_tuple = ((0, start_tokens[0][1]),) + tuple(start_tokens[1:])
+
+        if start_tuple in transition_states:
+            exact = True
+            ref_index, ref_anchor = len(start) - 1, chord_root(start[-1])
+        else:
+            # Try to find a context ending with the shape of the first chord
+            fallback_states = [key for key in transition_states if key[-1][1] == start_tokens[0][1]]
+            if fallback_states:
+                start_tuple = fallback_states[rng.integers(len(fallback_states))]
+            else:
+                start_tuple = list(transition_states)[rng.integers(len(transition_states))]
+            ref_index, ref_anchor = len(start_tuple) - 1, chord_root(start[0])
+
+    new_tokens = list(start_tuple)
+    m_order = len(start_tuple)
+
+    while len(new_tokens) < size:
+        if deadline is not None and deadline.expired():
+            new_tokens += [(0, new_tokens[-1][1])] * (size - len(new_tokens))  # out of time: hold the last chord
+            break
+        current_state = ((0, new_tokens[-m_order][1]),) + tuple(new_tokens[-m_order + 1:])
+        if current_state in transition_states:
+            potential_next_states = transition_states[current_state]
+        else:
+            potential_next_states = get_lower_order_state(transition_states, list(current_state))
+
+        if not potential_next_states:
+            break
+
+        new_tokens.append(potential_next_states[rng.integers(len(potential_next_states))])
+
+    new_sequence = relative_to_absolute(new_tokens, ref_index=ref_index, ref_anchor=ref_anchor)
+    if exact:
+        # exact start sequence found: keep the input voicing of the start chords
+        new_sequence[:len(start)] = [list(chord) for chord in start]
+    return new_sequence
+
+
+def encode_progressions(progressions):
+    """ --- Integer chord ids of all songs ---
+    Parameters:
+        progressions (list[list[tuple]]): one list of chords (or relative tokens) per song
+    Returns:
+        ids (np.ndarray): int64 chord ids of all songs, concatenated
+        song_index (np.ndarray): song number of every entry in ids
+        vocab (list[tuple]): chord id -> chord
+    """
+    all_chords = [tuple(ch) for song in progressions for ch in song]
+    vocab, ch2i, _ = get_unique_midi_chords(all_chords)
+    ids = np.fromiter(map(ch2i.__getitem__, all_chords), dtype=np.int64, count=len(all_chords))
+    song_index = np.repeat(np.arange(len(progressions)), [len(song) for song in progressions])
+    return ids, song_index, vocab
+
+
+def count_ngrams(ids, song_index, n, vocab_size):
+    """ --- Count all n-grams of chord ids, never across song boundaries ---
+    One sliding window view over all songs; windows whose first and last chord belong to different
+    songs are dropped. Every n-gram is packed into one int64 key (ceil(log2(vocab_size)) bits per chord)
+    and counted with np.unique; if the key does not fit into 63 bits, the n-gram rows are counted directly.
+    Returns:
+        ngrams (np.ndarray): unique n-grams sorted lexicographically, shape (n_unique, n)
+        counts (np.ndarray): occurrences of each n-gram
+    """
+    if len(ids) < n:
+        return np.empty((0, n), dtype=np.int64), np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(ids, n)
+    windows = windows[song_index[:len(windows)] == song_index[n - 1:]]
+
+    bits = max(1, int(np.ceil(np.log2(max(vocab_size, 2)))))
+    if n * bits > 63:
+        return np.unique(windows, axis=0, return_counts=True)
+
+    shifts = np.arange(n - 1, -1, -1, dtype=np.int64) * bits
+    keys = np.bitwise_or.reduce(windows << shifts, axis=1)
+    keys, counts = np.unique(keys, return_counts=True)
+    ngrams = (keys[:, None] >> shifts) & ((1 << bits) - 1)
+    return ngrams, counts
+
+
+def compute_transition_chain_from_songs(songs, m_order=2, relative=False):
+    """ --- Compute Transition Chain from per-song sequences (vectorized) ---
+    Same model as compute_transition_chain / compute_relative_transition_chain, but contexts never
+    span two songs and the n-grams are counted on integer arrays instead of one index at a time.
+    Parameters:
+        songs (list[list[tuple]]): chords (MIDI notes) of every song
+        m_order (int): Order for Markov Chain
+        relative (bool): learn the transposition-invariant model over (step, shape) tokens
+    Returns:
+        transition_states (dict): Transition States (successors repeated by their count)
+    """
+    if relative:
+        songs = [to_relative_sequence(song) for song in songs]
+    ids, song_index, vocab = encode_progressions(songs)
+    ngrams, counts = count_ngrams(ids, song_index, m_order + 1, len(vocab))
+    if not len(ngrams):
+        return {}  # no song is longer than m_order
+
+    # n-grams are sorted, so all successors of one context are contiguous
+    new_context = np.concatenate([[True], np.any(ngrams[1:, :-1] != ngrams[:-1, :-1], axis=1)])
+    starts = np.flatnonzero(new_context)
+    offsets = np.concatenate([[0], np.cumsum(counts)])[np.append(starts, len(ngrams))].tolist()
+    successors = [vocab[i] for i in np.repeat(ngrams[:, -1], counts).tolist()]
+    contexts = ngrams[starts, :-1].tolist()
+
+    transition_states = {}
+    for context, start, end in zip(contexts, offsets, offsets[1:]):
+        prev_states = tuple([vocab[i] for i in context])
+        if relative:
+            prev_states = ((0, prev_states[0][1]),) + prev_states[1:]
+        transition_states.setdefault(prev_states, []).extend(successors[start:end])
+    return transition_states
+
+
 def generate_new_sequence_oldest(start=None, transition_states=None, size=100):
     """ --- Generate New Sequence from Transition States ---
     Parameters:
@@ -215,41 +415,62 @@ def generate_new_sequence_old1(start=None, transition_states=None, size=100):
     return [list(chord) for chord in new_sequence]
 
 
-def generate_new_sequence(start=None, transition_states=None, size=100):
+def find_start_state(start, transition_states, rng=None):
+    """ --- Find the Transition State to start generating from ---
+    Parameters:
+        start (list[tuple]): starting chord(s), or None for a random state
+        transition_states (dict): the Markov model
+        rng (np.random.Generator): random stream (None: fresh entropy)
+    Returns:
+        start_tuple (tuple): the exact start sequence if it is a known state, else a random state
+        ending with the first start chord, else a random state
+    """
+    rng = np.random.default_rng(rng)
+    if not start:
+        return list(transition_states)[rng.integers(len(transition_states))]
+
+    # Ensure start is a tuple of tuples
+    if isinstance(start[0], int):
+        # Single chord passed as a tuple like (60, 64, 67)
+        start = [start]
+    start_tuple = tuple(start)
+
+    # Try to find an exact match in transition states
+    if start_tuple in transition_states:
+        return start_tuple  # exact start sequence found
+
+    # Try to find a matching sequence ending with the first chord
+    fallback_states = [key for key in transition_states if key[-1] == start[0]]
+    if fallback_states:
+        return fallback_states[rng.integers(len(fallback_states))]
+
+    # Absolute fallback: pick a random key
+    return list(transition_states)[rng.integers(len(transition_states))]
+
+
+def generate_new_sequence(start=None, transition_states=None, size=100, rng=None, deadline=None):
     """
     Generate a new sequence from transition states, optionally seeded with a multi-chord start phrase.
     Parameters:
         start (list[tuple]): starting sequence of chords (e.g. [(60, 64, 67), (62, 65, 69)])
         transition_states (dict): the Markov model
         size (int): length of sequence to generate
+        rng (np.random.Generator | int | np.random.SeedSequence): random stream or seed (None: fresh entropy).
+            Pass one Generator per request for thread-safe, reproducible generation.
+        deadline (Deadline): once it passed, sampling stops and the last chord is held up to size
     Returns:
         new_sequence (list[list]): generated note sequence
     """
-    if not start:
-        start = list(transition_states)[np.random.randint(len(transition_states))]
-    else:
-        # Ensure start is a tuple of tuples
-        if isinstance(start[0], int):
-            # Single chord passed as a tuple like (60, 64, 67)
-            start = [start]
-        start_tuple = tuple(start)
-        
-        # Try to find an exact match in transition states
-        if start_tuple in transition_states:
-            pass  # exact start sequence found
-        else:
-            # Try to find a matching sequence ending with the first chord
-            fallback_states = [key for key in transition_states if key[-1] == start[0]]
-            if fallback_states:
-                start_tuple = fallback_states[np.random.randint(0, len(fallback_states))]
-            else:
-                # Absolute fallback: pick a random key
-                start_tuple = list(transition_states)[np.random.randint(len(transition_states))]
+    rng = np.random.default_rng(rng)
+    start_tuple = find_start_state(start, transition_states, rng=rng)
 
     # Initialize new sequence
     new_sequence = list(start_tuple)
 
     for _ in range(size):
+        if deadline is not None and deadline.expired():
+            new_sequence += [new_sequence[-1]] * (size - len(new_sequence))  # out of time: hold the last chord
+            break
         current_state = tuple(new_sequence[-len(start_tuple):])
         if current_state in transition_states:
             potential_next_states = transition_states[current_state]
@@ -259,7 +480,7 @@ def generate_new_sequence(start=None, transition_states=None, size=100):
         if not potential_next_states:
             break
 
-        next_state = potential_next_states[np.random.randint(len(potential_next_states))]
+        next_state = potential_next_states[rng.integers(len(potential_next_states))]
         new_sequence.append(next_state)
 
         if len(new_sequence) >= size:
@@ -314,32 +535,37 @@ def get_unique_midi_chords(chord_progressions_all: list[str]) -> tuple[list[str]
     return unique_chords, ch2i, i2ch
 
 
-def generate_transition_matrix(data_path, m_order: int = 3) -> None:
-    """ Parse Choco Chord Data into Transition Matrix and write to file """
+def dump_pickle(obj, path):
+    """ Write a pickle to path.new and rename it into place, so readers never see a half-written file """
+    with open(f"{path}.new", 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(f"{path}.new", path)
 
-    # Define path to jams files
-    files = load_file_list(data_path)
 
-    # Retrieve chord progressions from all files
-    chord_progressions = get_progressions(files)
-    chord_progressions_all = [
-        item for sublist in chord_progressions for item in sublist
-        if isinstance(item, str)
-    ]
+def generate_transition_matrix(data_path, m_order: int = 3, relative: bool = False, prune_args: dict = None) -> None:
+    """ Parse Choco Chord Data into Transition Matrix and write to file
+    relative: learn the transposition-invariant model instead (written to relative_transition_matrix.pkl)
+    prune_args: if set, prune the model with model_pruning.prune_transition_chain(**prune_args) """
 
-    chord_progressions_notes = chords_to_midi_notes(chord_progressions_all)
-
-    # Save Set of Unique Chords
-    unique_midi_chords = set([tuple(ch) for ch in chord_progressions_notes])
-    with open('unique_midi_chords.pkl', 'wb') as f:
-        pickle.dump(unique_midi_chords, f)
+    # Retrieve chord progressions from all files (one list of MIDI chords per song), via the compiled corpus cache
+    chord_progressions = load_progressions(data_path)
+    songs_notes = [chords_to_midi_notes([item for item in song if isinstance(item, str)])
+                   for song in chord_progressions]
 
     # Generate New Sequence based on Markov Chain
-    transition_matrix = compute_transition_chain(chord_progressions_notes, m_order=m_order)
+    transition_matrix = compute_transition_chain_from_songs(songs_notes, m_order=m_order, relative=relative)
+    model_file = 'relative_transition_matrix.pkl' if relative else 'transition_matrix.pkl'
+
+    if prune_args:
+        from model_pruning import estimate_model_size, prune_transition_chain
+        transition_matrix = prune_transition_chain(transition_matrix, **prune_args)
+        print(f"Pruned model: {len(transition_matrix)} contexts, {estimate_model_size(transition_matrix) / 1e6:.1f} MB")
 
-    # Save the dictionary to a file
-    with open('transition_matrix.pkl', 'wb') as f:
-        pickle.dump(transition_matrix, f)
+    # Save the dictionary to a file, then the Set of Unique Chords: a running server (model_store.py) reloads
+    # once both files were replaced, the vocabulary is written last
+    dump_pickle(transition_matrix, model_file)
+    unique_midi_chords = set([tuple(ch) for song in songs_notes for ch in song])
+    dump_pickle(unique_midi_chords, 'unique_midi_chords.pkl')
 
 
 def main():
@@ -347,11 +573,14 @@ def main():
 
     # Settings for Markov Chain
     m_order = 4
+    relative = False  # True: transposition-invariant model in relative interval space
+    prune_args = None  # e.g. dict(min_count=2, top_k=8, memory_budget=200 * 2**20), see model_pruning.py
 
     # Learn Chord Progressions for Markov Chain
-    generate_transition_matrix("data/jams", m_order=m_order)
+    generate_transition_matrix("data/jams", m_order=m_order, relative=relative, prune_args=prune_args)
 
-    print('Saved Transition Matrix and Unique Chords to transition_matrix.pkl and unique_midi_chords.pkl')
+    model_file = 'relative_transition_matrix.pkl' if relative else 'transition_matrix.pkl'
+    print(f'Saved Transition Matrix and Unique Chords to {model_file} and unique_midi_chords.pkl')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+import numpy as np
+
+""" Follow an external MIDI clock (24 pulses per quarter note) and start/stop/continue transport.
+The tempo and beat phase are a least-squares line through the arrival times of the recent clock pulses,
+so single late or early pulses (USB/driver jitter) do not shift the beat grid, and beat positions are
+computed from the fitted line instead of accumulating per-event deltas. """
+
+ppqn = 24  # MIDI clock pulses per quarter note
+
+
+class ClockFollower:
+    def __init__(self, bpm=120, history=96):
+        """ --- Tempo and phase estimate from MIDI clock ---
+        Parameters:
+            bpm (float): tempo assumed until enough clock pulses arrived
+            history (int): number of recent pulses in the fit (96 = one 4/4 bar), shorter follows tempo changes faster
+        """
+        self.default_bpm = bpm
+        self.history = history
+        self.running = False
+        self.tick = 0  # index of the next clock pulse since start (song position)
+        self.ticks = []  # recent (tick, timestamp) pairs
+        self.start_time = None
+        self.fit = None  # (timestamp of tick 0, seconds per tick)
+
+    def feed(self, msg, timestamp):
+        """ Update the transport state with one message received at timestamp (seconds, monotonic clock) """
+        if msg.type == 'start':
+            self.running, self.tick, self.ticks, self.fit = True, 0, [], None
+            self.start_time = timestamp
+        elif msg.type == 'continue':
+            self.resync()  # the pause breaks the line through the old pulses
+            self.running = True
+            self.start_time = timestamp - self.tick * self.seconds_per_tick
+        elif msg.type == 'stop':
+            self.running = False
+        elif msg.type == 'songpos':
+            self.resync()
+            self.tick = msg.pos * ppqn // 4  # song position is counted in sixteenth notes
+        elif msg.type == 'clock' and self.running:
+            self.ticks.append((self.tick, timestamp))
+            del self.ticks[:-self.history]
+            self.tick += 1
+            self.update_fit()
+
+    def resync(self):
+        """ Drop the pulse history (the line breaks at a jump or pause) but keep the tempo estimate """
+        self.default_bpm, self.ticks, self.fit = self.bpm, [], None
+
+    def update_fit(self):
+        if len(self.ticks) < 2:
+            return
+        ticks, times = np.array(self.ticks, dtype=float).T
+        seconds_per_tick, offset = np.polyfit(ticks, times, 1)
+        if seconds_per_tick > 0:
+            self.fit = (offset, seconds_per_tick)
+
+    @property
+    def seconds_per_tick(self):
+        return self.fit[1] if self.fit else 60.0 / (self.default_bpm * ppqn)
+
+    @property
+    def bpm(self):
+        """ Current tempo estimate """
+        return 60.0 / (self.seconds_per_tick * ppqn)
+
+    def tick_zero_time(self):
+        """ Timestamp of song position 0 on the fitted line """
+        if self.fit:
+            return self.fit[0]
+        if self.ticks:
+            return self.ticks[0][1] - self.ticks[0][0] * self.seconds_per_tick
+        return self.start_time
+
+    def beat_at(self, timestamp):
+        """ Beat position (quarter notes since start, fractional) of a timestamp """
+        return (timestamp - self.tick_zero_time()) / (self.seconds_per_tick * ppqn)
+
+    def time_of_beat(self, beat):
+        """ Timestamp of a beat position, e.g. to derive analysis window boundaries """
+        return self.tick_zero_time() + beat * ppqn * self.seconds_per_tick
+
+    def phase(self, timestamp):
+        """ Position within the current beat in [0, 1) """
+        return self.beat_at(timestamp) % 1.0
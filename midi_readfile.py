@@ -1,6 +1,9 @@
 import mido
+import numpy as np
 import time
 
+from note_events import notes_in_window, pair_notes, read_midi_file
+
 """
 This script simulates receiving MIDI messages and analyzes notes over two bars.
 It assumes a MIDI file with two bars at 120 BPM, where each bar is 4 beats long (4/4 meter).
@@ -9,20 +12,16 @@ The script collects note events and analyzes them in two defined windows.
 
 mid = mido.MidiFile("data/midi/dummy_2bars.mid")  # load midi file
 
-note_states = {}
-events = []
+messages = []
+times = []
 start_time = time.time()
 
 print("Starting MIDI playback simulation...")
 for msg in mid.play():  # simulates real-time playback
     now = time.time()
-    elapsed = now - start_time
-
-    if msg.type == "note_on" and msg.velocity > 0:
-        note_states[msg.note] = (elapsed, msg.velocity)
-    elif (msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0)) and msg.note in note_states:
-        on_time, velocity = note_states.pop(msg.note)
-        events.append((msg.note, on_time, elapsed))
+    if msg.type in ("note_on", "note_off"):
+        messages.append(msg)
+        times.append(now - start_time)
 print("Finished playback. Analyzing windows & notes...")
 
 # analysis windows
@@ -32,13 +31,15 @@ WINDOWS = [
     (2 * BEAT_DURATION, 4 * BEAT_DURATION + BEAT_DURATION)  # beats 3-1 (next bar)
 ]
 
+times = np.array(times)
+# ticks of the arrival times through the file's own tempo map (exact up to the playback timing jitter)
+_, tempo_map = read_midi_file(mid)
+events = pair_notes(messages, tempo_map.seconds_to_tick(times).round().astype(np.int64), times)
+
+
 def get_notes_in_window(events, start, end):
-    notes = set()
-    for note, on_time, off_time in events:
-        if on_time < end and off_time > start:
-            if not (on_time == end or off_time == start):  # edge case: starts exactly at end or ends exactly at start
-                notes.add(note)
-    return notes
+    # notes sounding at any time in the window; starting exactly at its end or ending exactly at its start do not count
+    return set(notes_in_window(events, start, end))
 
 window1_notes = get_notes_in_window(events, *WINDOWS[0])
 window2_notes = get_notes_in_window(events, *WINDOWS[1])
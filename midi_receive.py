@@ -1,33 +1,48 @@
 import mido
 import time
 
+from midi_clock import ClockFollower
+
 
 ### parameters
-BPM = 120
+USE_MIDI_CLOCK = True  # follow the sender's MIDI clock and start/stop; False: fixed BPM from the first event
+BPM = 120  # fixed tempo (also the clock follower's tempo until enough clock pulses arrived)
 BEAT_DURATION = 60 / BPM  # @120bpm: 0.5s per beat
-BAR_DURATION = 4 * BEAT_DURATION  # @120bpm: 2s per bar
+BAR_BEATS = 4
 WINDOWS = [
-    (0, 2 * BEAT_DURATION),  # duration: beat 1 to 3 (bar 1)
-    (2 * BEAT_DURATION, BAR_DURATION + BEAT_DURATION)  # duration: beat 3 to beat 1 of bar 2
+    (0, 2),  # beats: beat 1 to 3 (bar 1)
+    (2, BAR_BEATS + 1)  # beats: beat 3 to beat 1 of bar 2
 ]
 
 
 ### receive MIDI
-note_states = {}  # active notes: note -> (on_time, velocity)
-events = []  # finished notes: list of (note, on_time, off_time)
+note_states = {}  # active notes: note -> (on_beat, velocity)
+events = []  # finished notes: list of (note, on_beat, off_beat)
 
+clock = ClockFollower(bpm=BPM) if USE_MIDI_CLOCK else None
 start_time = None
 in_port = mido.open_input("Python MIDI Input", virtual=True)
-print("Waiting for incoming 2-bar MIDI...")
+print("Waiting for MIDI start (clock sync)..." if USE_MIDI_CLOCK else "Waiting for incoming 2-bar MIDI...")
 while True:
     msg = in_port.receive()
 
-    now = time.time()
-    if start_time is None:
-        start_time = now
-        print("Starting recording...")
-
-    elapsed = now - start_time
+    now = time.perf_counter()
+    if USE_MIDI_CLOCK:
+        was_running = clock.running
+        clock.feed(msg, now)
+        if not clock.running:
+            if was_running:
+                print("Transport stopped. Analyzing windows...")
+                break
+            continue
+        if not was_running:
+            print("Transport started, starting recording...")
+        elapsed = clock.beat_at(now)  # position on the clock's beat grid
+    else:
+        if start_time is None:
+            start_time = now
+            print("Starting recording...")
+        elapsed = (now - start_time) / BEAT_DURATION  # beats since the first event
 
     if msg.type == "note_on" and msg.velocity > 0:
         note_states[msg.note] = (elapsed, msg.velocity)
@@ -36,8 +51,8 @@ while True:
         on_time, velocity = note_states.pop(msg.note)
         events.append((msg.note, on_time, elapsed))
 
-    # Stop analyzing after 2 bars (4 seconds at 120 bpm)
-    if elapsed >= 2 * BAR_DURATION:
+    # Stop analyzing after 2 bars (8 beats, 4 seconds at 120 bpm)
+    if elapsed >= 2 * BAR_BEATS:
         print("Done recording. Analyzing windows...")
         break
 
@@ -1,54 +1,87 @@
 import mido
+import queue
 import time
 import markov_main as mkv
 from estimate_notes import get_chord_from_notes, get_closest_chord
+from midi_clock import ClockFollower
 from datetime import datetime
 
 
-BPM = 120
+USE_MIDI_CLOCK = True  # follow the sender's MIDI clock and start/stop; False: fixed BPM from the first event
+BPM = 120  # fixed tempo (also the clock follower's tempo until enough clock pulses arrived)
 BEATS_PER_BAR = 4
 TOTAL_BARS = 2
 SECONDS_PER_BEAT = 60 / BPM  # 0.5s
-TOTAL_DURATION = SECONDS_PER_BEAT * BEATS_PER_BAR * TOTAL_BARS
+TOTAL_BEATS = BEATS_PER_BAR * TOTAL_BARS
+TOTAL_DURATION = SECONDS_PER_BEAT * TOTAL_BEATS
 DELTA = 0.0  # 0.02 = 20 ms
 
 timeout_seconds = 10
 wait_start = time.time()
 
 print("If notes are not recorded properly, check delta time for the analysis windows.")
-print("Waiting for first MIDI event...")
-in_port = mido.open_input("Python MIDI Input", virtual=True)  # creates virtual input
-while True:
-    msg = in_port.poll()
-    if msg:
-        print(f"Received first MIDI msg: {msg}")
-        start_time = time.time()  # start timing now
-        note_events = [(0, msg)]  # timestamp 0 relative to first event
-        break
-    if time.time()-wait_start > timeout_seconds:
+arrivals = queue.Queue()  # (arrival timestamp, msg), filled by the port's callback thread
+in_port = mido.open_input("Python MIDI Input", virtual=True,
+                          callback=lambda msg: arrivals.put((time.perf_counter(), msg)))  # creates virtual input
+note_events = []  # (beat position, msg)
+
+if USE_MIDI_CLOCK:
+    # beat positions come from the sender's clock, the recording spans TOTAL_BEATS from its start message
+    clock = ClockFollower(bpm=BPM)
+    print("Waiting for MIDI start (clock sync)...")
+    while True:
+        try:
+            now, msg = arrivals.get(timeout=0.1)  # blocks; the timestamp was taken on arrival
+        except queue.Empty:
+            if not clock.running and time.time()-wait_start > timeout_seconds:
+                print(f"No MIDI start after {timeout_seconds} seconds, exiting.")
+                exit()
+            continue
+        was_running = clock.running
+        clock.feed(msg, now)
+        if clock.running and not was_running:
+            print(f"Transport started, recording {TOTAL_BEATS} beats...")
+        elif was_running and not clock.running:
+            print("Transport stopped.")
+            break
+        if not clock.running:
+            continue
+        beat = clock.beat_at(now)
+        if msg.type in ["note_on", "note_off"]:
+            note_events.append((beat, msg))  # position on the clock's beat grid
+            print(f"Received msg: {msg} at beat {beat:.2f}")
+        elif msg.type == "clock" and beat >= TOTAL_BEATS:
+            break
+    print(f"Finished recording, tempo {clock.bpm:.1f} BPM.")
+else:
+    print("Waiting for first MIDI event...")
+    try:
+        start_time, msg = arrivals.get(timeout=timeout_seconds)  # start timing at the first event
+    except queue.Empty:
         print(f"No MIDI input after {timeout_seconds} seconds, exiting.")
         exit()
-    time.sleep(0.001)  # avoid busy waiting
+    print(f"Received first MIDI msg: {msg}")
+    note_events = [(0, msg)]  # beat 0 at the first event
 
-# record for 2 bars
-print(f"Started recording for {TOTAL_DURATION} seconds...")
-while time.time()-start_time < TOTAL_DURATION:
-    msg = in_port.poll()
-    if msg and msg.type in ["note_on", "note_off"]:
-        note_events.append((time.time()-start_time, msg))  # timestamp relative to bar start
-        print(f"Received msg: {msg}")
-print("Finished recording.")
+    # record for 2 bars
+    print(f"Started recording for {TOTAL_DURATION} seconds...")
+    while (remaining := start_time + TOTAL_DURATION - time.perf_counter()) > 0:
+        try:
+            now, msg = arrivals.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if msg.type in ["note_on", "note_off"]:
+            note_events.append(((now - start_time) / SECONDS_PER_BEAT, msg))  # beats since the first event
+            print(f"Received msg: {msg}")
+    print("Finished recording.")
 
 
 # Process the data
 def get_notes_between(start_beat, end_beat):
     """ Return all note_on messages that started between two beats. """
-    start_sec = start_beat * SECONDS_PER_BEAT
-    end_sec = end_beat * SECONDS_PER_BEAT
-
     active_notes = set()
-    for t, msg in note_events:
-        if start_sec <= t < end_sec:
+    for beat, msg in note_events:
+        if start_beat <= beat < end_beat:
             if msg.type == "note_on" and msg.velocity > 0:
                 active_notes.add(msg.note)
             elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
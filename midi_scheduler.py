@@ -0,0 +1,161 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter, deque
+
+import mido
+from mido import Message
+
+""" Live MIDI playback of generated sequences with look-ahead timing.
+Messages are queued ahead of time on a heap keyed by their timestamp on the monotonic perf_counter clock.
+A single sender thread sleeps on a Condition until shortly before the next timestamp and spins for the
+last stretch, so messages leave within a fraction of a millisecond of their time and no thread sleeps per note.
+Scheduling new messages (or stopping) wakes the sender, so sequences can be queued while others play.
+A sequence without an explicit start is queued after the one still playing on its channel, and a note held by
+several sequences is only released by the last note_off, so overlapping sequences never cut each other's notes. """
+
+spin_time = 0.002  # seconds before a timestamp at which the sender stops sleeping and busy-waits
+start_delay = 0.05  # look-ahead of a sequence scheduled "now": time to queue all of it before the first note
+lateness_history = 10000  # most recent messages kept for the jitter statistics
+
+
+def beats_to_seconds(beats, bpm):
+    """ Duration of a number of quarter-note beats at a tempo """
+    return beats * 60.0 / bpm
+
+
+class MidiScheduler:
+    def __init__(self, port, bpm=120):
+        """ --- Timestamped MIDI output ---
+        Parameters:
+            port (mido output port | str): open output port, or the name of one to open
+            bpm (float): tempo used to convert beats to seconds
+        """
+        self.port = mido.open_output(port) if isinstance(port, str) else port
+        self.bpm = bpm
+        self.queue = []  # heap of (timestamp, order, message)
+        self.order = itertools.count()  # keeps messages with equal timestamps in scheduling order
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.lateness = deque(maxlen=lateness_history)  # seconds recent messages were sent after their timestamp
+        self.sent = 0  # messages sent since the start
+        self.next_free = {}  # channel -> timestamp at which its last queued sequence ends
+        self.sounding = Counter()  # (channel, note) -> note_ons not yet released (sender thread only)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, all_notes_off=True):
+        """ Stop the sender thread, dropping queued messages and optionally silencing all channels """
+        with self.condition:
+            self.running = False
+            self.queue.clear()
+            self.next_free.clear()
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.sounding.clear()
+        if all_notes_off:
+            for channel in range(16):
+                self.port.send(Message('control_change', channel=channel, control=123, value=0))
+
+    def schedule(self, message, timestamp):
+        """ Queue a message to be sent at a time.perf_counter() timestamp """
+        with self.condition:
+            heapq.heappush(self.queue, (timestamp, next(self.order), message))
+            if self.queue[0][2] is message:
+                self.condition.notify()  # the new message is due first, wake the sender
+
+    def schedule_sequence(self, sequence, chord_duration=2, start=None, velocity=64, channel=0):
+        """ --- Queue a chord sequence for playback ---
+        Parameters:
+            sequence (list[list[int]]): chords as MIDI notes, as generated by main_process()
+            chord_duration (float): length of every chord in beats (as in create_midi_file)
+            start (float): time.perf_counter() timestamp of the first chord
+                (None: when the channel's queued sequences end, at the earliest start_delay from now)
+            velocity (int): note-on velocity
+            channel (int): MIDI channel
+        Returns:
+            end (float): timestamp at which the last chord ends, to queue a following sequence seamlessly
+        """
+        duration = beats_to_seconds(chord_duration, self.bpm)
+        with self.condition:
+            if start is None:
+                start = max(time.perf_counter() + start_delay, self.next_free.get(channel, 0.0))
+            end = start + len(sequence) * duration
+            self.next_free[channel] = max(end, self.next_free.get(channel, 0.0))
+            for i, chord in enumerate(sequence):
+                on, off = start + i * duration, start + (i + 1) * duration
+                for note in chord:
+                    # note-offs are queued before the next chord's note-ons at the same timestamp
+                    heapq.heappush(self.queue, (off, next(self.order), Message('note_off', note=int(note), velocity=0, channel=channel)))
+                    heapq.heappush(self.queue, (on, next(self.order), Message('note_on', note=int(note), velocity=velocity, channel=channel)))
+            self.condition.notify()
+        return end
+
+    def run(self):
+        """ Sender loop: wait for the next due message, send it, repeat """
+        while True:
+            with self.condition:
+                while self.running and (not self.queue or self.queue[0][0] - time.perf_counter() > spin_time):
+                    timeout = self.queue[0][0] - time.perf_counter() - spin_time if self.queue else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                timestamp, _, message = self.queue[0]
+            while time.perf_counter() < timestamp:
+                pass  # spin for the last stretch, sleeping is not precise enough
+            with self.condition:
+                if not self.queue or self.queue[0][0] != timestamp:
+                    continue  # queue changed while spinning (stopped or an earlier message was added)
+                heapq.heappop(self.queue)
+            if not self.releases(message):
+                continue  # another sequence still holds the note
+            self.port.send(message)
+            self.lateness.append(time.perf_counter() - timestamp)
+            self.sent += 1
+
+    def releases(self, message):
+        """ Count note_ons per (channel, note); False for a note_off while another note_on still holds the note """
+        if message.type not in ('note_on', 'note_off'):
+            return True
+        key = (message.channel, message.note)
+        if message.type == 'note_on' and message.velocity > 0:
+            self.sounding[key] += 1
+            return True
+        if self.sounding[key] > 1:
+            self.sounding[key] -= 1
+            return False
+        del self.sounding[key]
+        return True
+
+    def jitter(self):
+        """ Mean and maximum lateness of the last lateness_history sent messages in milliseconds """
+        if not self.lateness:
+            return 0.0, 0.0
+        return 1000 * sum(self.lateness) / len(self.lateness), 1000 * max(self.lateness)
+
+
+def main():
+    """ Play a short progression to the virtual port Max listens on (see midi_send1.py) """
+
+    # Settings
+    port_name = "Python MIDI Input"
+    bpm = 120
+    sequence = [[60, 64, 67], [57, 60, 64], [53, 57, 60], [55, 59, 62]]
+
+    scheduler = MidiScheduler(port_name, bpm=bpm).start()
+    end = scheduler.schedule_sequence(sequence, chord_duration=2)
+    time.sleep(max(0.0, end - time.perf_counter()) + 0.1)  # only the main thread waits for playback to finish
+    scheduler.stop()
+    mean, worst = scheduler.jitter()
+    print(f"Sent {scheduler.sent} messages, lateness mean {mean:.3f} ms, max {worst:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
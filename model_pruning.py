@@ -0,0 +1,158 @@
+import sys
+from collections import Counter
+
+import numpy as np
+
+from corpus_cache import load_progressions
+from markov_sequence_generator import chords_to_midi_notes, compute_transition_chain_from_songs
+
+""" Pruning of the Markov transition model to a memory budget, with a size and held-out likelihood report """
+
+dict_entry_bytes = 48  # approximate cost of one dict slot (hash, key and value pointers, free space)
+unseen_log_prob = np.log(1e-6)  # floor for successors the model never saw in the matched context
+
+
+def intern_chords(transition_states):
+    """ Rebuild the model so every distinct chord is one shared tuple object (also shrinks the pickle) """
+    chords = {}
+
+    def intern(chord):
+        return chords.setdefault(chord, chord)
+
+    return {tuple(intern(ch) for ch in key): [intern(ch) for ch in successors]
+            for key, successors in transition_states.items()}
+
+
+def context_size(key, successors):
+    """ Approximate bytes of one context: key tuple, successor list and dict slot (chords are shared) """
+    return sys.getsizeof(key) + sys.getsizeof(successors) + dict_entry_bytes
+
+
+def estimate_model_size(transition_states):
+    """ Approximate in-memory size of an interned model in bytes """
+    chords = {ch for key, successors in transition_states.items() for ch in key + tuple(successors)}
+    size = sys.getsizeof(transition_states) + sum(sys.getsizeof(ch) for ch in chords)
+    return size + sum(context_size(key, successors) for key, successors in transition_states.items())
+
+
+def prune_transition_chain(transition_states, min_count=2, top_k=None, memory_budget=None):
+    """ --- Prune a transition chain ---
+    Parameters:
+        transition_states (dict): Transition States from compute_transition_chain
+        min_count (int): drop contexts seen fewer than min_count times
+        top_k (int): keep only the k most frequent successors per context
+        memory_budget (int): if set, keep the most frequent contexts that fit into this many bytes
+    Returns:
+        pruned (dict): same format; the kept successors keep their counts (repetitions), so sampling
+        from the list is renormalized over the remaining successors automatically
+    Raises:
+        ValueError: if no context is left (the model is empty, or min_count or memory_budget removed everything)
+    """
+    pruned = {}
+    for key, successors in transition_states.items():
+        if len(successors) < min_count:
+            continue
+        if top_k is not None:
+            counts = Counter(successors).most_common(top_k)
+            successors = [chord for chord, count in counts for _ in range(count)]
+        pruned[key] = successors
+    pruned = intern_chords(pruned)
+
+    if memory_budget is not None and estimate_model_size(pruned) > memory_budget:
+        # keep the most frequently seen contexts until the budget is used up
+        chords = {ch for key, successors in pruned.items() for ch in key + tuple(successors)}
+        size = sys.getsizeof(pruned) + sum(sys.getsizeof(ch) for ch in chords)
+        budgeted = {}
+        for key in sorted(pruned, key=lambda key: len(pruned[key]), reverse=True):
+            size += context_size(key, pruned[key])
+            if size > memory_budget:
+                break
+            budgeted[key] = pruned[key]
+        pruned = budgeted
+
+    if not pruned:
+        raise ValueError(f"Pruning left no context of the {len(transition_states)} in the model "
+                         f"(min_count={min_count}, memory_budget={memory_budget})")
+    return pruned
+
+
+def backoff_tables(transition_states):
+    """ --- Successor counts for every order, computed once ---
+    Returns:
+        tables (dict): {order: {context: Counter(successors)}} from m_order down to 1,
+        the same statistics get_lower_order_state() derives on every miss
+    """
+    if not transition_states:
+        raise ValueError("Empty transition model")
+    m_order = len(next(iter(transition_states)))
+    tables = {m_order: {key: Counter(successors) for key, successors in transition_states.items()}}
+    for order in range(m_order - 1, 0, -1):
+        lower = {}
+        for key, counts in tables[order + 1].items():
+            lower.setdefault(key[1:], Counter()).update(counts)
+        tables[order] = lower
+    return tables
+
+
+def held_out_log_likelihood(transition_states, songs):
+    """ --- Average log-likelihood of held-out songs (lists of chords) ---
+    Every chord is predicted from the longest context found in the model (as generation backs off),
+    with a floor probability for successors never seen in that context.
+    Returns:
+        log_likelihood (float): mean natural log-probability per predicted chord
+        backoff_rate (float): fraction of predictions that had to back off to a lower order
+    """
+    tables = backoff_tables(transition_states)
+    m_order = max(tables)
+    log_probs, backoffs = [], 0
+    for song in songs:
+        sequence = [tuple(chord) for chord in song]
+        for i in range(m_order, len(sequence)):
+            log_prob = unseen_log_prob
+            for order in range(m_order, 0, -1):
+                counts = tables[order].get(tuple(sequence[i - order:i]))
+                if counts is not None:
+                    if counts[sequence[i]]:
+                        log_prob = np.log(counts[sequence[i]] / counts.total())
+                    break
+            backoffs += order < m_order or counts is None
+            log_probs.append(log_prob)
+    if not log_probs:
+        return float('nan'), float('nan')
+    return float(np.mean(log_probs)), backoffs / len(log_probs)
+
+
+def pruning_report(train_songs, test_songs, m_order=4, **prune_args):
+    """ Train on train_songs, prune with prune_args and report size and held-out likelihood on test_songs before/after """
+    full = intern_chords(compute_transition_chain_from_songs(train_songs, m_order=m_order))
+    pruned = prune_transition_chain(full, **prune_args)
+    report = {}
+    for name, model in [("full", full), ("pruned", pruned)]:
+        log_likelihood, backoff_rate = held_out_log_likelihood(model, test_songs)
+        report[name] = {
+            'contexts': len(model),
+            'successors': sum(len(successors) for successors in model.values()),
+            'bytes': estimate_model_size(model),
+            'log_likelihood': log_likelihood,
+            'backoff_rate': backoff_rate,
+        }
+        print(f"{name}: {report[name]['contexts']} contexts, {report[name]['bytes'] / 1e6:.1f} MB, "
+              f"held-out log-likelihood {log_likelihood:.3f}/chord, backoff rate {backoff_rate:.1%}")
+    return pruned, report
+
+
+def main():
+    """ Report the effect of pruning on a 90/10 song split of the corpus """
+
+    # Settings
+    m_order = 6
+    prune_args = dict(min_count=2, top_k=8, memory_budget=200 * 2**20)
+
+    songs = [chords_to_midi_notes([ch for ch in song if isinstance(ch, str)])
+             for song in load_progressions("data/jams")]
+    split = int(len(songs) * 0.9)
+    pruning_report(songs[:split], songs[split:], m_order=m_order, **prune_args)
+
+
+if __name__ == "__main__":
+    main()
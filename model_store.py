@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from markov_sequence_generator import generate_new_sequence, generate_new_relative_sequence
+
+""" Hot reloading of the model for resident processes (osc_server.py).
+A watcher thread polls the modification times of the model files. When all of them changed (a retrain replaces
+the model and then the vocabulary, so a new vocabulary is never paired with the old model) and stayed unchanged
+for one more poll (so a file that is still being written is not read), it loads, builds and validates the new version
+in a spawned subprocess (so neither competes with the serving threads for the GIL), receives it pickled and swaps it in
+with a single reference assignment. A request takes the current version once with
+get() and keeps using it, so in-flight generations finish on the old model; a failed load keeps the old one. """
+
+poll_interval = 1.0  # seconds between checks of the model files
+
+
+def file_versions(paths):
+    """ (mtime, size) of every path, None for missing files """
+    versions = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            versions.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            versions.append(None)
+    return versions
+
+
+def validate_model(data, relative=False):
+    """ Check that loaded (unique_midi_chords, transition_matrix) data can generate, raise ValueError if not """
+    unique_midi_chords, transition_matrix = data
+    if not len(unique_midi_chords):
+        raise ValueError("Empty chord vocabulary")
+    rng = np.random.default_rng(0)
+    if isinstance(transition_matrix, dict):
+        if not transition_matrix:
+            raise ValueError("Empty transition matrix")
+        generate = generate_new_relative_sequence if relative else generate_new_sequence
+        sequence = generate(None, transition_matrix, size=4, rng=rng)
+    else:
+        sequence = transition_matrix.generate(None, size=4, rng=rng)
+    if not sequence:
+        raise ValueError("Model generated an empty sequence")
+
+
+def load_and_validate(loader, validate):
+    """ Reload subprocess: load the data and check it """
+    data = loader()
+    if validate is not None:
+        validate(data)
+    return data
+
+
+class ModelStore:
+    def __init__(self, loader, paths, validate=validate_model, isolate=True):
+        """ --- Current model version, reloaded when its files change ---
+        Parameters:
+            loader (callable): returns the model data, e.g. functools.partial(load_data, trie=True)
+            paths (list[str]): files to watch, all rewritten by one update, e.g. markov_main.model_files()
+            validate (callable): raises on unusable data (None: no check)
+            isolate (bool): reload in a subprocess (loader and validate must then be picklable, e.g. module-level
+                functions or partials of them); False for loaders that only map files (MappedModel), whose arrays
+                would be copied through the pickle, and in daemonic pool workers, which cannot start processes
+        """
+        self.loader = loader
+        self.paths = paths
+        self.validate = validate
+        self.isolate = isolate
+        self.versions = file_versions(paths)
+        self.data = loader()
+        self.generation = 0  # number of reloads, for logging
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def get(self):
+        """ Current model data; hold on to the returned object for the whole request """
+        return self.data
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def watch(self):
+        pending = None  # changed versions seen in the last poll
+        while not self.stopped.wait(poll_interval):
+            versions = file_versions(self.paths)
+            if None in versions or any(new == old for new, old in zip(versions, self.versions)):
+                pending = None  # unchanged, or an update that has not replaced every file yet
+            elif versions != pending:
+                pending = versions  # changed: wait for one more poll without changes
+            else:
+                self.reload(versions)
+                pending = None
+
+    def reload(self, versions):
+        """ Load, validate and swap in a new version (the old one stays on any error) """
+        start = time.perf_counter()
+        try:
+            if self.isolate:
+                # a clean process per reload (the server has threads, so no fork); only the unpickling runs here
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    data = executor.submit(load_and_validate, self.loader, self.validate).result()
+            else:
+                data = load_and_validate(self.loader, self.validate)
+        except Exception as e:
+            print(f"Model reload failed, keeping the current model: {e!r}")
+            self.versions = versions  # do not retry until the files change again
+            return
+        self.data = data  # atomic: requests see either the old or the new version
+        self.versions = versions
+        self.generation += 1
+        print(f"Reloaded model (version {self.generation}) in {time.perf_counter() - start:.2f} s")
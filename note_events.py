@@ -0,0 +1,105 @@
+import mido
+import numpy as np
+
+""" Note events as one NumPy structured array (pitch, velocity, channel, note on/off in ticks and seconds),
+shared by the MIDI readers instead of lists of namedtuples, tuples or mido messages.
+TempoMap keeps the cumulative seconds at every tempo change, so converting whole arrays of ticks or beats to
+seconds is one searchsorted call instead of a walk through the tempo changes per value. """
+
+default_tempo = 500000  # microseconds per beat (120 BPM), the MIDI default until the first set_tempo
+
+note_dtype = np.dtype([('pitch', np.uint8), ('velocity', np.uint8), ('channel', np.uint8),
+                       ('on_tick', np.int64), ('off_tick', np.int64),
+                       ('on', np.float64), ('off', np.float64)])  # on/off in seconds
+
+
+class TempoMap:
+    def __init__(self, ticks_per_beat, tempo_changes=()):
+        """ --- Piecewise linear tick -> seconds map ---
+        Parameters:
+            ticks_per_beat (int): resolution of the MIDI file
+            tempo_changes (list): (absolute tick, tempo in microseconds per beat) pairs, in file order
+        """
+        changes = {0: default_tempo}
+        for tick, tempo in tempo_changes:
+            changes[int(tick)] = tempo  # the last change at a tick wins
+        self.ticks_per_beat = ticks_per_beat
+        self.ticks = np.array(sorted(changes), dtype=np.int64)
+        self.tempos = np.array([changes[tick] for tick in self.ticks], dtype=np.float64)
+        self.seconds_per_tick = self.tempos / (1e6 * ticks_per_beat)
+        # seconds at every tempo change: sum of the segments before it
+        self.seconds = np.concatenate(([0.0], np.cumsum(np.diff(self.ticks) * self.seconds_per_tick[:-1])))
+
+    def tick_to_seconds(self, ticks):
+        """ Seconds of (arrays of) absolute ticks; before tick 0 the first tempo is extended """
+        ticks = np.asarray(ticks, dtype=np.float64)
+        i = np.maximum(np.searchsorted(self.ticks, ticks, side='right') - 1, 0)
+        return self.seconds[i] + (ticks - self.ticks[i]) * self.seconds_per_tick[i]
+
+    def beat_to_seconds(self, beats):
+        return self.tick_to_seconds(np.asarray(beats, dtype=np.float64) * self.ticks_per_beat)
+
+    def seconds_to_tick(self, seconds):
+        """ Absolute ticks (float) of (arrays of) seconds, the inverse of tick_to_seconds() """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        i = np.maximum(np.searchsorted(self.seconds, seconds, side='right') - 1, 0)
+        return self.ticks[i] + (seconds - self.seconds[i]) / self.seconds_per_tick[i]
+
+    def seconds_to_beat(self, seconds):
+        return self.seconds_to_tick(seconds) / self.ticks_per_beat
+
+
+def pair_notes(messages, ticks, seconds):
+    """ --- Note array from timed messages ---
+    Note on and note off (or note on with velocity 0) of the same channel and pitch are paired first in, first out;
+    notes still sounding at the end are closed at the last message.
+    Parameters:
+        messages (list): mido messages in time order (other message types are skipped)
+        ticks (array): absolute tick of every message
+        seconds (array): absolute time in seconds of every message
+    Returns:
+        events (np.ndarray): note_dtype array sorted by note on
+    """
+    sounding = {}  # (channel, pitch) -> list of (message index, velocity)
+    rows = []
+    for i, msg in enumerate(messages):
+        if msg.type == 'note_on' and msg.velocity > 0:
+            sounding.setdefault((msg.channel, msg.note), []).append((i, msg.velocity))
+        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+            starts = sounding.get((msg.channel, msg.note))
+            if starts:
+                on, velocity = starts.pop(0)
+                rows.append((msg.note, velocity, msg.channel, ticks[on], ticks[i], seconds[on], seconds[i]))
+    last = len(messages) - 1
+    for (channel, pitch), starts in sounding.items():
+        for on, velocity in starts:
+            rows.append((pitch, velocity, channel, ticks[on], ticks[last], seconds[on], seconds[last]))
+    events = np.array(rows, dtype=note_dtype)
+    return events[np.argsort(events['on_tick'], kind='stable')]
+
+
+def read_midi_file(filename):
+    """ --- Note events and tempo map of a MIDI file, in one pass over its merged tracks ---
+    Returns:
+        events (np.ndarray): note_dtype array sorted by note on
+        tempo_map (TempoMap): tempo changes of the file
+    """
+    mid = filename if isinstance(filename, mido.MidiFile) else mido.MidiFile(filename)
+    messages, ticks, tempo_changes = [], [], []
+    tick = 0
+    for msg in mido.merge_tracks(mid.tracks):  # msg.time: delta ticks
+        tick += msg.time
+        if msg.type == 'set_tempo':
+            tempo_changes.append((tick, msg.tempo))
+        elif msg.type in ('note_on', 'note_off'):
+            messages.append(msg)
+            ticks.append(tick)
+    tempo_map = TempoMap(mid.ticks_per_beat, tempo_changes)
+    ticks = np.array(ticks, dtype=np.int64)
+    return pair_notes(messages, ticks, tempo_map.tick_to_seconds(ticks)), tempo_map
+
+
+def notes_in_window(events, start, end):
+    """ Sorted pitches of the notes sounding at any time in [start, end) seconds """
+    active = (events['on'] < end) & (events['off'] > start)
+    return sorted(set(events['pitch'][active].tolist()))
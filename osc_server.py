@@ -1,27 +1,259 @@
 import argparse
+import functools
+import itertools
+import multiprocessing
+import os
+import time
+
+import mido
+import numpy as np
 
 from pythonosc import dispatcher
 from pythonosc import osc_server
-from markov_main import main
+from pythonosc import osc_bundle_builder, osc_message_builder, udp_client
+import markov_main
+from markov_main import generate_sequence, load_data, main, model_files
+from shared_model import model_path
+from model_store import ModelStore, validate_model
+from pregen_cache import PregenCache
+from deadline import Deadline, deadline_stats
+from analysis_worker import AnalysisWorker
+from sessions import SessionManager
+from markov_sequence_generator import chords_to_midi_notes
+from create_midi import create_midi_bytes, create_midi_file
+from midi_scheduler import MidiScheduler
+import vae_numpy
 
 
 def some_function():
     print("Function triggered!")
 
 
-def handle_osc_message(unused_addr, *args):
-    print("OSC message received:", args)
-    main()
+def request_seed():
+    """ --- Independent random stream for one request ---
+    Spawned from the server's SeedSequence via a unique spawn key, so concurrent requests never share
+    generator state (no locking) and any request can be replayed bit-exactly from its logged seed:
+        main(rng=np.random.SeedSequence(entropy, spawn_key=(key,)))
+    """
+    seed = np.random.SeedSequence(root_seed.entropy, spawn_key=(next(request_counter),))
+    print(f"Request seed: entropy={seed.entropy} spawn_key={seed.spawn_key}")
+    return seed
+
+
+def request_rng():
+    return np.random.default_rng(request_seed())
+
+
+def init_worker():
+    """ Pool worker start-up: map the exported model (shared by all workers through the page cache),
+    remapped whenever shared_model.py exports a new one """
+    global worker_store
+    # export_model() replaces the arrays, meta.npy last, and does not rewrite the vocabulary: watch meta.npy only
+    worker_store = ModelStore(lambda: load_data(mapped=True), model_files(mapped=True)[1:], isolate=False).start()
+
+
+def worker_main(seed, deadline):
+    """ Generate in a pool worker; the file is written by the server (workers would all write the same one) """
+    new_chord_sequence = main(rng=np.random.default_rng(seed), data=worker_store.get(), write_file=False, deadline=deadline)
+    return new_chord_sequence, deadline
+
+
+def deliver_worker_result(result, session):
+    new_chord_sequence, deadline = result
+    if deadline is not None:
+        deadline_stats.record(deadline)  # the worker's own count is not visible here
+    deliver(new_chord_sequence, session)
+    write_session_file(new_chord_sequence, session)
+
+
+def pregen_generate(key, rng, deadline):
+    """ Generation of the pre-generation cache, key: (closest chord, length); from the current model """
+    return generate_sequence(model_store.get()[1], *key, relative=markov_main.relative, beam=markov_main.beam, rng=rng,
+                             deadline=deadline)
+
+
+def send_reply(new_chord_sequence, reply_client):
+    """ --- Send a chord sequence to the reply address ---
+    "notes": one bundle with a message per chord (its MIDI notes as int arguments), delivered together and in order
+    "midi": one message with the Standard MIDI File bytes as a blob, as create_midi_file() would write them
+    """
+    if args.reply_format == "midi":
+        message = osc_message_builder.OscMessageBuilder(args.reply_address)
+        message.add_arg(create_midi_bytes(new_chord_sequence, chord_duration=2), osc_message_builder.OscMessageBuilder.ARG_TYPE_BLOB)
+        reply_client.send(message.build())
+        return
+    bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+    for chord in new_chord_sequence:
+        message = osc_message_builder.OscMessageBuilder(args.reply_address)
+        for note in chord:
+            message.add_arg(int(note))
+        bundle.add_content(message.build())
+    reply_client.send(bundle.build())
+
+
+def session_reply_client(session):
+    """ OSC client replying to the session's sender (--reply-to-sender), else the configured reply client """
+    if session is None or not args.reply_to_sender or session.key[0] != "osc":
+        return reply_client
+    if not hasattr(session, "reply_client"):
+        session.reply_client = udp_client.SimpleUDPClient(session.key[1], args.reply_port)
+    return session.reply_client
+
+
+def deliver(new_chord_sequence, session=None):
+    """ Hand a generated sequence to the configured outputs (OSC reply, live MIDI on the session's channel) """
+    client = session_reply_client(session)
+    if client is not None:
+        send_reply(new_chord_sequence, client)
+    if midi_scheduler is not None:
+        midi_scheduler.schedule_sequence(new_chord_sequence, chord_duration=2, channel=session.channel if session else 0)
+
+
+def write_session_file(new_chord_sequence, session):
+    """ Write a session's sequence to its own MIDI file (session_<key>_new.mid), so sessions never share one """
+    if args.write_file:
+        create_midi_file(new_chord_sequence, chord_duration=2, file_name=session.file_name)
+
+
+def session_key(client_address, address):
+    """ Session of an OSC message: the client id of /trigger/<id> or /note/<id>, else the client's ip (--session-by-ip)
+    or its ip and port (one session per socket) """
+    parts = address.split("/", 2)
+    if len(parts) == 3 and parts[2]:
+        return ("osc", parts[2])
+    return ("osc", client_address[0]) if args.session_by_ip else ("osc",) + tuple(client_address)
+
+
+def handle_osc_message(client_address, address, *osc_args):
+    """ /trigger[/<id>] [seconds]: generate a sequence, needed within seconds (e.g. until the next downbeat) if a number
+    is given. Every OSC client is a session with its own random stream; notes it sent with /note are the input,
+    without notes the input file of markov_main.main() is analyzed. The server handles each message in its own thread. """
+    print(f"OSC message received from {client_address} on {address}:", osc_args)
+    session = sessions.get(session_key(client_address, address))
+    deadline = Deadline(osc_args[0]) if osc_args and isinstance(osc_args[0], (int, float)) else None  # e.g. not "bang"
+    captured = session.take_capture()
+    if captured and pool is None:
+        handle_capture(session, captured, deadline)
+        return
+    if pool is not None:
+        # an idle worker takes the request, the result comes back on the pool's result thread
+        # (perf_counter is the system-wide monotonic clock, so the deadline holds in the worker too)
+        pool.apply_async(worker_main, (session.request_seed(), deadline),
+                         callback=lambda result: deliver_worker_result(result, session), error_callback=print)
+        return
+    with session.generate_lock:  # this client's triggers in order, other clients run concurrently
+        new_chord_sequence = main(rng=np.random.default_rng(session.request_seed()), data=model_store.get(),
+                                  write_file=False, cache=pregen_cache, deadline=deadline, analyzer=analyzer)
+        session.last_sequence = new_chord_sequence
+        session.generations += 1
+    deliver(new_chord_sequence, session)
+    write_session_file(new_chord_sequence, session)
+
+
+def handle_note_message(client_address, address, *osc_args):
+    """ /note[/<id>] pitch [velocity]: a note played by an OSC client (velocity 0: note off), captured in its session """
+    if not osc_args or not isinstance(osc_args[0], int):
+        print(f"Ignoring {address} {osc_args}: expected pitch [velocity]")
+        return
+    velocity = int(osc_args[1]) if len(osc_args) > 1 and isinstance(osc_args[1], (int, float)) else 64
+    session = sessions.get(session_key(client_address, address))
+    msg = mido.Message("note_on", note=osc_args[0], velocity=velocity, channel=session.channel)
+    sessions.add_note(session, msg, time.perf_counter(), handle_midi_capture)
+
+
+def handle_capture(session, captured, deadline=None):
+    """ Generate from the chord windows of a session's capture, with the settings of the /trigger path """
+    unique_midi_chords, transition_matrix = model_store.get()
+    generate = lambda start, size, rng: generate_sequence(transition_matrix, start, size, relative=markov_main.relative,
+                                                          beam=markov_main.beam, rng=rng, deadline=deadline)
+    new_chord_sequence = session.generate_from_capture(captured, unique_midi_chords, generate)
+    if deadline is not None:
+        deadline_stats.record(deadline)
+    deliver(new_chord_sequence, session)
+    write_session_file(new_chord_sequence, session)
+
+
+def handle_midi_capture(session, captured):
+    """ A session's capture is complete (on the session thread pool): generate from its chord windows, needed by the
+    next downbeat """
+    handle_capture(session, captured, Deadline.at_time(sessions.next_downbeat(time.perf_counter())))
+
+
+def handle_vae_message(unused_addr, *osc_args):
+    """ Generate chords with the NumPy VAE decoder (no TensorFlow in this process) """
+    print("OSC VAE message received:", osc_args)
+    if vae_weights is None:
+        print("No exported VAE decoder found, run vae.py first.")
+        return
+    num_samples = int(osc_args[0]) if osc_args else 1
+    for i, labels in enumerate(vae_numpy.generate_chords(vae_weights, num_samples=num_samples, rng=request_rng())):
+        print(f"VAE chords: {labels}")
+        new_chord_sequence = chords_to_midi_notes(labels)
+        if args.write_file:
+            create_midi_file(new_chord_sequence, chord_duration=2, file_name=f"vae_{i}")
+        deliver(new_chord_sequence)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--ip", default="127.0.0.1", help="The ip to listen on")
     parser.add_argument("--port", type=int, default=5005, help="The port to listen on")
+    parser.add_argument("--vae", default="vae_decoder.npz", help="Exported VAE decoder weights")
+    parser.add_argument("--midi-out", default=None, help="MIDI output port to play generated sequences on (e.g. 'Python MIDI Input')")
+    parser.add_argument("--bpm", type=float, default=120, help="Tempo of the live MIDI output")
+    parser.add_argument("--workers", type=int, default=0, help="Generation worker processes sharing the model exported by shared_model.py (0: generate in the server process)")
+    parser.add_argument("--reply-ip", default=None, help="Send generated chords back over OSC to this ip (e.g. 127.0.0.1)")
+    parser.add_argument("--reply-port", type=int, default=5006, help="The port to send replies to")
+    parser.add_argument("--reply-address", default="/chords", help="OSC address of the replies")
+    parser.add_argument("--reply-format", choices=["notes", "midi"], default="notes", help="Chords as note lists or as MIDI file bytes in a blob")
+    parser.add_argument("--no-file", dest="write_file", action="store_false", help="Do not write generated sequences to MIDI files")
+    parser.add_argument("--pregen", type=int, default=0, help="Sequences kept ready per matched chord (0: generate on every trigger; not with --workers)")
+    parser.add_argument("--analysis-worker", action="store_true", help="Run audio analysis (essentia) in a separate warm process")
+    parser.add_argument("--reply-to-sender", action="store_true", help="Reply to the ip of each OSC client (its own session) at --reply-port")
+    parser.add_argument("--midi-in", default=None, help="MIDI input port to capture performers from, one session per channel (not with --workers)")
+    parser.add_argument("--seed", type=int, default=None, help="Entropy of the session seed (to replay a session)")
+    parser.add_argument("--session-by-ip", action="store_true", help="One session per client ip instead of per ip and port (clients sending from changing ports)")
     args = parser.parse_args()
 
+    root_seed = np.random.SeedSequence(args.seed)
+    request_counter = itertools.count()  # next() is atomic, so spawn keys are unique across threads
+    print(f"Session seed: entropy={root_seed.entropy}")
+
+    if markov_main.beam and markov_main.relative:
+        raise SystemExit("markov_main.beam needs the absolute model, set markov_main.relative = False")
+    if args.workers:
+        try:
+            validate_model(load_data(mapped=True))  # a pool whose initializer fails respawns its workers forever
+        except Exception as e:
+            raise SystemExit(f"No usable model export in {model_path}/ for --workers ({e!r}), run shared_model.py first")
+    pool = multiprocessing.Pool(args.workers, initializer=init_worker) if args.workers else None  # before any thread starts
+    if pool is None:
+        # load the model once, reload it in the background when it is retrained
+        relative, trie = markov_main.relative, markov_main.trie
+        # reloads build the trie and validate in a subprocess: loader and validate are partials, which pickle
+        model_store = ModelStore(functools.partial(load_data, relative=relative, trie=trie), model_files(relative=relative),
+                                 validate=functools.partial(validate_model, relative=relative)).start()
+    pregen_cache = None
+    if args.pregen and pool is None:
+        # candidates are generated in the background from the current model; a reload invalidates them
+        pregen_cache = PregenCache(pregen_generate,
+                                   seed=np.random.SeedSequence(root_seed.entropy, spawn_key=(0, 0)),  # apart from request keys
+                                   version=lambda: model_store.generation, per_key=args.pregen)
+    analyzer = AnalysisWorker() if args.analysis_worker else None
+    reply_client = udp_client.SimpleUDPClient(args.reply_ip, args.reply_port) if args.reply_ip else None
+    sessions = SessionManager(root_seed, bpm=args.bpm)
+    if args.midi_in and pool is None:
+        sessions.listen(args.midi_in, handle_midi_capture)
+    midi_scheduler = MidiScheduler(args.midi_out, bpm=args.bpm).start() if args.midi_out else None
+    vae_weights = vae_numpy.load_decoder_weights(args.vae) if os.path.exists(args.vae) else None
+
     dispatcher = dispatcher.Dispatcher()
-    dispatcher.map("/trigger", handle_osc_message)
+    dispatcher.map("/trigger", handle_osc_message, needs_reply_address=True)
+    dispatcher.map("/trigger/*", handle_osc_message, needs_reply_address=True)  # /trigger/<client id>
+    if pool is None:
+        dispatcher.map("/note", handle_note_message, needs_reply_address=True)
+        dispatcher.map("/note/*", handle_note_message, needs_reply_address=True)
+    dispatcher.map("/vae", handle_vae_message)
 
     server = osc_server.ThreadingOSCUDPServer((args.ip, args.port), dispatcher)
     print(f"Serving on {server.server_address}")
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+""" Speculative pre-generation: the closest chords matched during a performance are few and repeat, so ready
+candidate sequences are kept per seed key (closest chord, length) and a trigger pops one instead of generating.
+A background thread refills a key after every access while the musician plays. Every candidate is served once,
+candidates expire after max_age seconds, and the least recently used keys are evicted beyond max_keys.
+Every candidate keeps the seed it was generated from, which is logged when it is served, so a hit replays like a miss. """
+
+max_keys = 32  # seed keys kept (least recently used evicted)
+per_key = 4  # ready candidates per key
+max_age = 60.0  # seconds after which an unused candidate is dropped
+
+
+class PregenCache:
+    def __init__(self, generate, seed=None, version=None, max_keys=max_keys, per_key=per_key, max_age=max_age):
+        """ --- LRU cache of pre-generated sequences ---
+        Parameters:
+            generate (callable): generate(key, rng, deadline) -> new sequence for a seed key (deadline may be None)
+            seed (np.random.SeedSequence | int): root of the random streams of the background generations
+            version (callable): returns the current model version; candidates of older versions are dropped
+            max_keys, per_key, max_age: see the module settings
+        """
+        self.generate = generate
+        self.seed = np.random.SeedSequence(seed) if not isinstance(seed, np.random.SeedSequence) else seed
+        self.version = version or (lambda: None)
+        self.max_keys, self.per_key, self.max_age = max_keys, per_key, max_age
+        self.entries = OrderedDict()  # key -> deque of (created, version, sequence, seed), least recently used first
+        self.lock = threading.Lock()
+        self.refill_queue = queue.Queue()
+        self.pending = set()  # keys queued for refill
+        self.last_served = {}  # key -> last sequence returned, never queued again right after
+        self.hits = self.misses = 0
+        self.thread = threading.Thread(target=self.refill_loop, daemon=True)
+        self.thread.start()
+
+    def fresh(self, entry, now, version):
+        created, entry_version, _, _ = entry
+        return now - created <= self.max_age and entry_version == version
+
+    def get(self, key, rng=None, deadline=None):
+        """ A ready sequence for key if there is one (hit), else one generated now with rng (miss); queues a refill
+        deadline: Deadline of the request, passed to the generation on a miss """
+        now, version = time.monotonic(), self.version()
+        with self.lock:
+            candidates = self.entries.setdefault(key, deque())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_keys:
+                evicted, _ = self.entries.popitem(last=False)
+                self.last_served.pop(evicted, None)
+            while candidates and not self.fresh(candidates[0], now, version):
+                candidates.popleft()  # expired or from an old model
+            _, _, sequence, seed = candidates.popleft() if candidates else (None, None, None, None)
+            if sequence is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if key not in self.pending:
+                self.pending.add(key)
+                self.refill_queue.put(key)
+        if sequence is None:
+            sequence = self.generate(key, np.random.default_rng(rng), deadline)
+        else:
+            # the request's own seed did not make this sequence: log the one that did, to replay it
+            print(f"Pre-generated sequence for {key}, seed: entropy={seed.entropy} spawn_key={seed.spawn_key}")
+        self.last_served[key] = sequence
+        return sequence
+
+    def prefetch(self, keys):
+        """ Queue keys expected soon (e.g. every chord of the current input) for pre-generation """
+        with self.lock:
+            for key in keys:
+                self.entries.setdefault(key, deque())
+                if key not in self.pending:
+                    self.pending.add(key)
+                    self.refill_queue.put(key)
+
+    def refill_loop(self):
+        while True:
+            key = self.refill_queue.get()
+            with self.lock:
+                self.pending.discard(key)
+                candidates = self.entries.get(key)
+                missing = self.per_key - len(candidates) if candidates is not None else 0
+            for _ in range(missing):
+                version = self.version()
+                seed = self.seed.spawn(1)[0]
+                try:
+                    sequence = self.generate(key, np.random.default_rng(seed), None)
+                except Exception as e:
+                    print(f"Pre-generation for {key} failed: {e}")
+                    break
+                with self.lock:
+                    if key not in self.entries:
+                        break  # evicted meanwhile
+                    candidates = self.entries[key]
+                    if sequence == self.last_served.get(key) or any(sequence == queued for _, _, queued, _ in candidates):
+                        continue  # a repeat, the next trigger should sound different
+                    candidates.append((time.monotonic(), version, sequence, seed))
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,202 @@
+import itertools
+import math
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import mido
+import numpy as np
+
+from estimate_notes import get_chord_from_notes, get_closest_chord
+from midi_clock import ClockFollower
+
+""" Several performers into one machine: every performer gets a Session, keyed by MIDI channel or OSC client,
+that owns its capture buffer, analysis windows, random stream, output file and generation state.
+A session's locks keep its own requests in order; different sessions never wait for each other.
+Sessions idle for idle_timeout seconds are dropped. The seed of a session depends only on its key and on how
+often that key had a session before, both logged, so a session replays without the other sessions:
+    SeedSequence(entropy, spawn_key=(1, key_hash(key), incarnation, request)) """
+
+# Settings (as midi_receive2.py)
+beats_per_bar = 4
+total_bars = 2
+windows = [(0, 2), (2, 4), (4, 6), (6, 8)]  # beat windows analyzed for chords (bar 1 beat 1 to 3, ...)
+idle_timeout = 600.0  # seconds without activity after which a session is dropped
+
+
+def key_hash(key):
+    """ Stable 32-bit number of a session key (Python's hash() changes between runs) """
+    return zlib.crc32(repr(key).encode())
+
+
+class Session:
+    def __init__(self, key, seed, bpm=120, channel=0):
+        """ --- State of one performer ---
+        Parameters:
+            key (tuple): ("midi", channel), ("osc", client id), ("osc", ip) or ("osc", ip, port)
+            seed (np.random.SeedSequence): the session's seed; every request gets a stream spawned from it
+            bpm (float): tempo of the capture when no MIDI clock is running
+            channel (int): MIDI channel of the session's output
+        """
+        self.key = key
+        self.seed = seed
+        self.request_counter = itertools.count()
+        self.bpm = bpm
+        self.channel = channel
+        self.lock = threading.Lock()  # guards the capture buffer
+        self.generate_lock = threading.Lock()  # keeps the session's generations in order (capture goes on meanwhile)
+        self.note_events = []  # (beat since capture start, msg)
+        self.start_time = None  # timestamp of the first captured event
+        self.start_beat = None  # clock beat of the first captured event, when following MIDI clock
+        self.last_sequence = None  # generation state: last generated sequence
+        self.generations = 0
+        self.last_active = time.monotonic()
+        self.file_name = "session_" + "_".join(str(part).replace("/", "_") for part in key)  # own MIDI output file
+        print(f"New session {key}: entropy={seed.entropy} spawn_key={seed.spawn_key}")
+
+    def request_seed(self):
+        """ Seed of the session's next request, replayable from the logged spawn key """
+        return np.random.SeedSequence(self.seed.entropy, spawn_key=self.seed.spawn_key + (next(self.request_counter),))
+
+    def position(self, timestamp, clock=None):
+        """ Beat of timestamp in the current capture; the first event of a capture sets its start """
+        if clock is not None and clock.running:
+            beat = clock.beat_at(timestamp)
+            if self.start_beat is None:
+                self.start_beat = np.floor(beat)  # windows start at the beat the performer came in on
+            return beat - self.start_beat
+        if self.start_time is None:
+            self.start_time = timestamp
+        return (timestamp - self.start_time) * self.bpm / 60
+
+    def add_message(self, msg, timestamp, clock=None):
+        """ --- Capture a note message ---
+        Beats count from the session's first note, on the MIDI clock's beat grid if it is running.
+        Returns:
+            captured (list): the (beat, msg) events of a capture of total_bars completed by this message, which
+            starts the next capture, else None
+        """
+        with self.lock:
+            beat = self.position(timestamp, clock)
+            captured = None
+            if beat >= beats_per_bar * total_bars:
+                captured, self.note_events = self.note_events, []
+                self.start_time = self.start_beat = None
+                beat = self.position(timestamp, clock)  # first event of the next capture
+            self.note_events.append((beat, msg))
+            return captured
+
+    def take_capture(self):
+        """ The events captured so far (a new capture starts), e.g. for a trigger before total_bars are complete """
+        with self.lock:
+            captured, self.note_events = self.note_events, []
+            self.start_time = self.start_beat = None
+            return captured
+
+    @staticmethod
+    def window_chords(note_events):
+        """ Note sets (of at least 3 notes) of the analysis windows of a capture """
+        chords = []
+        for start, end in windows:
+            active_notes = set()
+            for beat, msg in note_events:
+                if start <= beat < end:
+                    if msg.type == "note_on" and msg.velocity > 0:
+                        active_notes.add(msg.note)
+                    elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
+                        active_notes.discard(msg.note)
+            if len(active_notes) >= 3:
+                chords.append(active_notes)
+        return chords
+
+    def generate_from_capture(self, note_events, unique_midi_chords, generate):
+        """ --- Generate from the windows of a capture, as midi_receive2.py does ---
+        Parameters:
+            note_events (list): a capture returned by add_message()
+            generate (callable): generate(start chords, size, rng) -> new sequence
+        """
+        chords_refined = []
+        for chord in self.window_chords(note_events):
+            input_chord, chord_length = get_chord_from_notes(chord)
+            closest_chord, distance = get_closest_chord(input_chord, unique_midi_chords, chord_length, weight=100.0)
+            chords_refined.append(closest_chord)
+        with self.generate_lock:
+            new_sequence = generate(chords_refined or None, max(len(chords_refined) * 2, 4),
+                                    np.random.default_rng(self.request_seed()))
+            self.last_sequence = new_sequence
+            self.generations += 1
+        print(f"Session {self.key}: chords {chords_refined} -> {new_sequence}")
+        return new_sequence
+
+
+class SessionManager:
+    def __init__(self, root_seed, bpm=120, max_workers=8, idle_timeout=idle_timeout):
+        """ Sessions by key, created on first use and dropped when idle; generations of different sessions run on a
+        thread pool """
+        self.root_seed = root_seed
+        self.bpm = bpm
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.incarnations = {}  # key -> number of sessions the key had, part of the spawn key
+        self.lock = threading.Lock()
+        self.clock = ClockFollower(bpm=bpm)  # one MIDI input: its clock is shared by all channels
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session")
+
+    def get(self, key, channel=0):
+        with self.lock:
+            now = time.monotonic()
+            self.expire(now)
+            if key not in self.sessions:
+                # session seeds are spawned apart from the server's request seeds (spawn keys of length 1)
+                incarnation = self.incarnations.get(key, 0)
+                self.incarnations[key] = incarnation + 1
+                seed = np.random.SeedSequence(self.root_seed.entropy, spawn_key=(1, key_hash(key), incarnation))
+                self.sessions[key] = Session(key, seed, bpm=self.bpm, channel=channel)
+            session = self.sessions[key]
+            session.last_active = now
+            return session
+
+    def expire(self, now):
+        """ Drop the sessions idle for longer than idle_timeout (not while they generate); call with self.lock held """
+        for key, session in list(self.sessions.items()):
+            if now - session.last_active > self.idle_timeout and not session.generate_lock.locked():
+                del self.sessions[key]
+                print(f"Session {key} expired after {self.idle_timeout:.0f} s idle")
+
+    def add_note(self, session, msg, timestamp, on_complete):
+        """ Capture a note message in a session; on_complete(session, captured) runs on the thread pool when the
+        session's capture is complete """
+        captured = session.add_message(msg, timestamp, self.clock)
+        if captured:
+            future = self.executor.submit(on_complete, session, captured)
+            future.add_done_callback(lambda future: log_failure(future, session))
+
+    def handle_midi(self, msg, timestamp, on_complete):
+        """ Route one incoming MIDI message: transport and clock to the shared clock, notes to the channel's session """
+        if msg.type in ("note_on", "note_off"):
+            self.add_note(self.get(("midi", msg.channel), channel=msg.channel), msg, timestamp, on_complete)
+        else:
+            self.clock.feed(msg, timestamp)
+
+    def next_downbeat(self, timestamp):
+        """ Timestamp of the next bar start on the MIDI clock, one bar from timestamp without a running clock """
+        if self.clock.running:
+            return self.clock.time_of_beat((math.floor(self.clock.beat_at(timestamp) / beats_per_bar) + 1) * beats_per_bar)
+        return timestamp + beats_per_bar * 60 / self.bpm
+
+    def listen(self, port_name, on_complete):
+        """ Receive from a MIDI input port on a background thread (one session per channel) """
+        def receive():
+            with mido.open_input(port_name) as in_port:
+                for msg in in_port:
+                    self.handle_midi(msg, time.perf_counter(), on_complete)
+        thread = threading.Thread(target=receive, daemon=True)
+        thread.start()
+        return thread
+
+
+def log_failure(future, session):
+    """ Done callback of a session generation: report its exception, which the thread pool would otherwise keep """
+    if future.exception() is not None:
+        print(f"Session {session.key}: generation failed: {future.exception()!r}")
@@ -0,0 +1,202 @@
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+""" The Markov model as flat NumPy arrays on disk, opened with mmap_mode='r'.
+Any number of worker processes can map the same files: the pages live once in the OS page cache, so model RAM
+stays constant with the number of workers and a worker starts without unpickling the model.
+Contexts of every order (the full order down to the empty context, i.e. the backoff tables of
+get_lower_order_state()) are packed into sorted int64 keys and looked up with np.searchsorted;
+the successors of a context are one contiguous slice with cumulative counts for sampling. """
+
+model_path = "model_arrays"
+note_bits = 7  # MIDI notes 0-127, for the packed chord keys
+
+
+def pack(ids, bits):
+    """ One int64 key per row of an (n, k) array of non-negative ids (bits per id, first column highest) """
+    ids = np.asarray(ids, dtype=np.int64)
+    shifts = np.arange(ids.shape[1] - 1, -1, -1, dtype=np.int64) * bits
+    return np.bitwise_or.reduce(ids << shifts, axis=1) if ids.shape[1] else np.zeros(len(ids), dtype=np.int64)
+
+
+def chord_keys(chords, max_len):
+    """ Packed key of every chord (its notes and its length) """
+    notes = np.zeros((len(chords), max_len), dtype=np.int64)
+    for i, chord in enumerate(chords):
+        notes[i, :len(chord)] = chord
+    lengths = np.array([len(chord) for chord in chords], dtype=np.int64)
+    return (lengths << (note_bits * max_len)) | pack(notes, note_bits)
+
+
+def group_successors(keys, successor_ids):
+    """ --- Sorted (context key, successor) table with counts ---
+    Returns:
+        context_keys (np.ndarray): unique context keys, sorted
+        offsets (np.ndarray): successors of context i are [offsets[i], offsets[i + 1])
+        successors (np.ndarray): successor ids
+        cumulative_counts (np.ndarray): running count of the successors within each context
+    """
+    order = np.lexsort((successor_ids, keys))
+    keys, successor_ids = keys[order], successor_ids[order]
+    new_pair = np.r_[True, (keys[1:] != keys[:-1]) | (successor_ids[1:] != successor_ids[:-1])]
+    starts = np.flatnonzero(new_pair)
+    counts = np.diff(np.r_[starts, len(keys)])
+    keys, successors = keys[starts], successor_ids[starts]
+
+    new_context = np.r_[True, keys[1:] != keys[:-1]]
+    offsets = np.r_[np.flatnonzero(new_context), len(keys)]
+    cumulative_counts = np.cumsum(counts)
+    cumulative_counts -= np.repeat(np.r_[0, cumulative_counts[offsets[1:-1] - 1]], np.diff(offsets))
+    return keys[new_context], offsets, successors.astype(np.int32), cumulative_counts
+
+
+def export_model(transition_states, path=model_path):
+    """ --- Write the dict model (from compute_transition_chain) as .npy arrays into the directory path ---
+    Raises:
+        ValueError: if a full-order context does not fit into a 63-bit key, or a chord has more than 8 notes
+    """
+    contexts = list(transition_states)
+    m_order = len(contexts[0])
+    chords = sorted({tuple(ch) for key, successors in transition_states.items() for ch in key + tuple(successors)})
+    ch2i = {chord: i for i, chord in enumerate(chords)}
+    bits = max(1, int(np.ceil(np.log2(max(len(chords), 2)))))
+    max_len = max(len(chord) for chord in chords)
+    if m_order * bits > 63 or max_len > 8:
+        raise ValueError(f"Model of order {m_order} with {len(chords)} chords of up to {max_len} notes does not fit into int64 keys")
+
+    arrays = {'meta': np.array([m_order, bits, max_len], dtype=np.int64)}
+    notes = np.full((len(chords), max_len), -1, dtype=np.int16)
+    for i, chord in enumerate(chords):
+        notes[i, :len(chord)] = chord
+    keys = chord_keys(chords, max_len)
+    arrays['chords'] = notes
+    arrays['chord_keys'] = np.sort(keys)
+    arrays['chord_key_ids'] = np.argsort(keys).astype(np.int32)
+
+    context_ids = np.array([[ch2i[tuple(ch)] for ch in key] for key in contexts], dtype=np.int64)
+    rows = np.repeat(np.arange(len(contexts)), [len(successors) for successors in transition_states.values()])
+    successor_ids = np.fromiter((ch2i[tuple(ch)] for successors in transition_states.values() for ch in successors),
+                                dtype=np.int64, count=len(rows))
+    for order in range(m_order, -1, -1):
+        keys = pack(context_ids[:, m_order - order:], bits)[rows]
+        for name, array in zip(['keys', 'offsets', 'successors', 'cumulative_counts'], group_successors(keys, successor_ids)):
+            arrays[f"{name}_{order}"] = array
+
+    # full-order contexts grouped by their last chord, for find_start_state()
+    full_keys = arrays[f"keys_{m_order}"]
+    last_chords = full_keys & ((1 << bits) - 1)
+    by_last = np.argsort(last_chords, kind='stable')
+    arrays['last_chords'] = last_chords[by_last]
+    arrays['last_index'] = by_last.astype(np.int32)
+
+    # write a new directory and swap it in: running workers keep their mapping of the old (unlinked) files
+    new_path, old_path = f"{path}.new", f"{path}.old"
+    shutil.rmtree(new_path, ignore_errors=True)
+    os.makedirs(new_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(new_path, f"{name}.npy"), array)
+    if os.path.exists(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+    os.rename(new_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    print(f"Exported model of order {m_order} ({len(chords)} chords, {len(contexts)} contexts) to {path}/")
+
+
+class MappedModel:
+    def __init__(self, path=model_path):
+        """ Memory-map the arrays written by export_model() (read-only, shared between processes) """
+        self.arrays = {file[:-len(".npy")]: np.load(os.path.join(path, file), mmap_mode='r')
+                       for file in os.listdir(path) if file.endswith(".npy")}
+        self.m_order, self.bits, self.max_len = (int(value) for value in self.arrays['meta'])
+
+    def chord_id(self, chord):
+        """ Id of a chord, None if it is not in the model """
+        if not 0 < len(chord) <= self.max_len or min(chord) < 0 or max(chord) >= 1 << note_bits:
+            return None
+        key = chord_keys([tuple(chord)], self.max_len)[0]
+        keys = self.arrays['chord_keys']
+        i = int(np.searchsorted(keys, key))
+        return int(self.arrays['chord_key_ids'][i]) if i < len(keys) and keys[i] == key else None
+
+    def chord(self, chord_id):
+        notes = self.arrays['chords'][chord_id]
+        return [int(note) for note in notes if note >= 0]
+
+    def successors(self, context_ids):
+        """ Successor ids and cumulative counts of the longest known suffix of context_ids (backing off to order 0) """
+        if None in context_ids:  # unknown chords (None ids) can only be backed off
+            context_ids = context_ids[len(context_ids) - context_ids[::-1].index(None):]
+        for order in range(min(self.m_order, len(context_ids)), -1, -1):
+            key = pack([context_ids[len(context_ids) - order:]], self.bits)[0]
+            keys = self.arrays[f"keys_{order}"]
+            i = int(np.searchsorted(keys, key))
+            if i < len(keys) and keys[i] == key:
+                start, end = self.arrays[f"offsets_{order}"][i:i + 2]
+                return self.arrays[f"successors_{order}"][start:end], self.arrays[f"cumulative_counts_{order}"][start:end]
+        return None, None
+
+    def context(self, index):
+        """ Chord ids of a full-order context """
+        key = int(self.arrays[f"keys_{self.m_order}"][index])
+        return [(key >> (self.bits * (self.m_order - 1 - j))) & ((1 << self.bits) - 1) for j in range(self.m_order)]
+
+    def find_start_state(self, start, rng):
+        """ Array equivalent of markov_sequence_generator.find_start_state(), on chord ids """
+        n_contexts = len(self.arrays[f"keys_{self.m_order}"])
+        if not start:
+            return self.context(rng.integers(n_contexts))
+        if isinstance(start[0], int):
+            start = [start]
+        start_ids = [self.chord_id(chord) for chord in start]
+        if None not in start_ids and len(start_ids) == self.m_order:
+            key = pack([start_ids], self.bits)[0]
+            keys = self.arrays[f"keys_{self.m_order}"]
+            i = int(np.searchsorted(keys, key))
+            if i < len(keys) and keys[i] == key:
+                return start_ids  # exact start sequence
+
+        # a context ending with the first chord
+        if start_ids[0] is not None:
+            last_chords = self.arrays['last_chords']
+            lo, hi = np.searchsorted(last_chords, [start_ids[0], start_ids[0] + 1])
+            if hi > lo:
+                return self.context(self.arrays['last_index'][lo + rng.integers(hi - lo)])
+        return self.context(rng.integers(n_contexts))
+
+    def generate(self, start=None, size=100, rng=None, deadline=None):
+        """ --- Generate a new sequence, as markov_sequence_generator.generate_new_sequence() ---
+        Parameters:
+            start (list[tuple]): starting chord(s), or None for a random context
+            size (int): length of sequence to generate
+            rng (np.random.Generator | int | np.random.SeedSequence): random stream or seed
+            deadline (Deadline): once it passed, sampling stops and the last chord is held up to size (deadline.hit is set)
+        Returns:
+            new_sequence (list[list]): generated note sequence
+        """
+        rng = np.random.default_rng(rng)
+        new_ids = self.find_start_state(start, rng)
+        while len(new_ids) < size:
+            if deadline is not None and deadline.expired():
+                new_ids += [new_ids[-1]] * (size - len(new_ids))  # out of time: hold the last chord
+                break
+            successors, cumulative_counts = self.successors(new_ids[-self.m_order:])
+            if successors is None or not len(successors):
+                break
+            r = rng.integers(cumulative_counts[-1])
+            new_ids.append(int(successors[np.searchsorted(cumulative_counts, r, side='right')]))
+        return [self.chord(chord_id) for chord_id in new_ids]
+
+
+def main():
+    """ Export transition_matrix.pkl for the worker pool of osc_server.py (--workers) """
+    with open("transition_matrix.pkl", "rb") as f:
+        transition_matrix = pickle.load(f)
+    export_model(transition_matrix)
+
+
+if __name__ == "__main__":
+    main()
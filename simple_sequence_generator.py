@@ -1,5 +1,4 @@
 import numpy as np
-import random
 
 
 chord_formulas = {
@@ -30,36 +29,45 @@ for chord_type in chord_formulas.keys():
     chord_notes[chord_type] = generate_chord_notes(root_note, chord_type)
 
 
-# Initialize transition matrix
-chords = list(chord_formulas.keys())
-transition_matrix = {chord: {next_chord: 0 for next_chord in chords} for chord in chords}
+def random_transition_matrix(rng=None):
+    """ Transition matrix between the chord types with random probabilities
+        Param: rng -- numpy Generator or seed (None: fresh entropy) """
+    rng = np.random.default_rng(rng)
+    chords = list(chord_formulas.keys())
+    transition_matrix = {chord: {next_chord: 0 for next_chord in chords} for chord in chords}
+    for chord in chords:
+        random_probs = rng.random(len(chords))
+        random_probs /= random_probs.sum()  # Normalize so it sums to 1
+        for i, next_chord in enumerate(chords):
+            transition_matrix[chord][next_chord] = random_probs[i]
+    return transition_matrix
 
-# Fill transition matrix with random probabilities
+
+# Fill transition matrix with random probabilities, seeded so every import builds the same one
 # or take the ones learned from Choco: transition_matrix.pkl
-for chord in chords:
-    random_probs = np.random.rand(len(chords))
-    random_probs /= random_probs.sum()  # Normalize so it sums to 1
-    for i, next_chord in enumerate(chords):
-        transition_matrix[chord][next_chord] = random_probs[i]
+transition_matrix_seed = 0
+transition_matrix = random_transition_matrix(transition_matrix_seed)
 
 
-def next_chord(current_chord):
+def next_chord(current_chord, rng=None):
     """ Chooses next chords based on current chord """
     next_chords = list(transition_matrix[current_chord].keys())
     probabilities = list(transition_matrix[current_chord].values())
-    return np.random.choice(next_chords, p=probabilities)
+    return str(np.random.default_rng(rng).choice(next_chords, p=probabilities))
 
 
-def generate_variation(melody, length=10):
+def generate_variation(melody, length=10, rng=None):
     """ Generates a variation of the input notes/melody.
-        Param: length -- the number of output notes """
+        Param: length -- the number of output notes
+        Param: rng -- numpy Generator or seed, for reproducible variations """
+    rng = np.random.default_rng(rng)
     variation = []
-    current_chord = random.choice(list(chord_formulas.keys()))
+    current_chord = str(rng.choice(list(chord_formulas.keys())))
     for note in melody:
         variation.append(note)
         chord_notes = generate_chord_notes(note, current_chord)
-        variation.extend(random.sample(chord_notes, min(len(chord_notes), length)))
-        current_chord = next_chord(current_chord)
+        variation.extend(rng.choice(chord_notes, size=min(len(chord_notes), length), replace=False).tolist())
+        current_chord = next_chord(current_chord, rng=rng)
     return variation
 
 
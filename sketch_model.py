@@ -0,0 +1,162 @@
+import pickle
+
+import numpy as np
+
+from corpus_cache import load_progressions
+from markov_sequence_generator import chords_to_midi_notes
+
+""" Approximate Markov model for very large corpora and high orders: the counts of long contexts live in a
+fixed-size count-min sketch, only the low orders are stored exactly. The memory ceiling is set up front. """
+
+prime = np.uint64(0x100000001B3)  # FNV-1a 64-bit prime, to combine chord ids into one key
+
+
+def splitmix64(x):
+    """ Vectorized 64-bit hash mixer (splitmix64 finalizer) on a uint64 array """
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def ngram_keys(ids):
+    """ One uint64 key per row of an (n, order + 1) array of chord ids (the order is part of the key) """
+    ids = np.asarray(ids, dtype=np.uint64)
+    keys = np.full(len(ids), ids.shape[1], dtype=np.uint64)
+    for column in ids.T:
+        keys = (keys ^ (column + np.uint64(1))) * prime
+    return keys
+
+
+class CountMinSketch:
+    """ Count-min sketch: depth rows of width uint32 counters; a query returns the minimum over the rows,
+    which never underestimates the true count and overestimates it only through hash collisions """
+
+    def __init__(self, width, depth=4, seed=0):
+        self.width = width
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.seeds = np.random.default_rng(seed).integers(1, 2**63, size=depth, dtype=np.uint64)
+
+    @classmethod
+    def from_memory(cls, memory_bytes, depth=4, seed=0):
+        """ Largest sketch that fits into memory_bytes """
+        return cls(max(1, memory_bytes // (4 * depth)), depth=depth, seed=seed)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def columns(self, keys):
+        """ Column of every key in every row, shape (depth, n) """
+        return (splitmix64(keys[None, :] ^ self.seeds[:, None]) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, counts=1):
+        for row, columns in zip(self.table, self.columns(keys)):
+            np.add.at(row, columns, counts)
+
+    def query(self, keys):
+        columns = self.columns(keys)
+        return np.min(np.take_along_axis(self.table, columns, axis=1), axis=0)
+
+
+class SketchTransitionModel:
+    def __init__(self, m_order=6, memory_bytes=256 * 2**20, exact_order=2, depth=4):
+        """ --- Markov model with exact low orders and sketched high orders ---
+        Parameters:
+            m_order (int): highest context order
+            memory_bytes (int): size of the count-min sketch for orders exact_order + 1 .. m_order
+            exact_order (int): orders up to this one are counted exactly in dicts
+            depth (int): number of hash rows of the sketch
+        """
+        self.m_order = m_order
+        self.exact_order = exact_order
+        self.sketch = CountMinSketch.from_memory(memory_bytes, depth=depth)
+        self.exact = {order: {} for order in range(0, exact_order + 1)}  # order -> {context ids: {successor id: count}}
+        self.chords = []  # chord id -> chord tuple
+        self.ch2i = {}
+
+    def encode(self, sequence):
+        """ Chord ids of a sequence of chords, growing the vocabulary """
+        for chord in sequence:
+            self.ch2i.setdefault(tuple(chord), len(self.ch2i))
+        self.chords = list(self.ch2i)
+        return np.array([self.ch2i[tuple(chord)] for chord in sequence], dtype=np.int64)
+
+    def train(self, songs):
+        """ Count the n-grams of every song (a list of chords), never across song boundaries """
+        for song in songs:
+            ids = self.encode(song)
+            for order in range(0, self.m_order + 1):
+                if len(ids) <= order:
+                    break
+                ngrams = np.lib.stride_tricks.sliding_window_view(ids, order + 1)
+                if order <= self.exact_order:
+                    table = self.exact[order]
+                    for *context, successor in ngrams.tolist():
+                        counts = table.setdefault(tuple(context), {})
+                        counts[successor] = counts.get(successor, 0) + 1
+                else:
+                    self.sketch.add(ngram_keys(ngrams))
+        return self
+
+    def successor_counts(self, context_ids):
+        """ --- Successor ids and counts for a context ---
+        Candidates come from the longest exact context found; their counts are taken from the longest
+        sketched order in which any of them was seen, else the exact counts are used.
+        """
+        for order in range(min(self.exact_order, len(context_ids)), -1, -1):
+            exact = self.exact[order].get(tuple(context_ids[len(context_ids) - order:]))
+            if exact:
+                break
+        candidates = np.fromiter(exact, dtype=np.int64)
+        for order in range(min(self.m_order, len(context_ids)), self.exact_order, -1):
+            context = np.broadcast_to(context_ids[-order:], (len(candidates), order))
+            counts = self.sketch.query(ngram_keys(np.column_stack([context, candidates])))
+            if counts.any():
+                return candidates, counts
+        return candidates, np.fromiter(exact.values(), dtype=np.int64)
+
+    def generate(self, start=None, size=100, rng=None, deadline=None):
+        """ --- Generate a new sequence, as markov_sequence_generator.generate_new_sequence() ---
+        Parameters:
+            start (list[tuple]): starting chord(s); unknown chords are skipped, none left: random chord
+            size (int): length of sequence to generate
+            rng (np.random.Generator | int | np.random.SeedSequence): random stream or seed
+            deadline (Deadline): once it passed, sampling stops and the last chord is held up to size (deadline.hit is set)
+        Returns:
+            new_sequence (list[list]): generated note sequence
+        """
+        rng = np.random.default_rng(rng)
+        if start and isinstance(start[0], int):
+            start = [start]
+        new_ids = [self.ch2i[tuple(chord)] for chord in start or [] if tuple(chord) in self.ch2i]
+        if not new_ids:
+            candidates, counts = self.successor_counts([])
+            new_ids = [int(rng.choice(candidates, p=counts / counts.sum()))]
+        while len(new_ids) < size:
+            if deadline is not None and deadline.expired():
+                new_ids += [new_ids[-1]] * (size - len(new_ids))  # out of time: hold the last chord
+                break
+            candidates, counts = self.successor_counts(new_ids[-self.m_order:])
+            new_ids.append(int(rng.choice(candidates, p=counts / counts.sum())))
+        return [list(self.chords[chord_id]) for chord_id in new_ids]
+
+
+def main():
+    """ Train the sketch model on the corpus and save it to sketch_model.pkl """
+
+    # Settings
+    m_order = 6
+    memory_bytes = 256 * 2**20  # memory ceiling of the sketch
+
+    songs = [chords_to_midi_notes([ch for ch in song if isinstance(ch, str)])
+             for song in load_progressions("data/jams")]
+    model = SketchTransitionModel(m_order=m_order, memory_bytes=memory_bytes).train(songs)
+    with open('sketch_model.pkl', 'wb') as f:
+        pickle.dump(model, f)
+    print(f"Saved sketch model ({model.sketch.nbytes / 2**20:.0f} MB sketch, {len(model.chords)} chords) to sketch_model.pkl")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import pickle
+
+import numpy as np
+import pytest
+
+estimate_notes = pytest.importorskip("estimate_notes", exc_type=ImportError)  # needs pretty_midi
+
+chords = [(60, 64, 67), (62, 65, 69), (55, 59, 62), (57, 60, 64), (60, 64, 67, 70), (48, 55, 64)]
+
+
+def test_vectorized_distances_match_pairwise():
+    notes = np.array([chord for chord in chords if len(chord) == 3], dtype=float)
+    expected = [estimate_notes.get_weighted_distance((61, 64, 68), chord, 100.0) for chord in notes]
+    np.testing.assert_allclose(estimate_notes.get_weighted_distances((61, 64, 68), notes, 100.0), expected)
+
+
+def test_lookup_tiers():
+    index = estimate_notes.ChordIndex(chords)
+    assert index.lookup((60, 64, 67), 3, 100.0) == ((60, 64, 67), 0.0)
+    assert index.lookup((67, 60, 64), 3, 100.0)[0] == (60, 64, 67)  # same notes, in another order
+    assert index.lookup((72, 76, 79), 3, 100.0)[0] == (60, 64, 67)  # nearest chord with the same pitch classes
+    assert index.lookup((61, 65, 68), 3, 100.0)[0] in {(60, 64, 67), (62, 65, 69)}  # transposed major triad
+    assert index.lookup((60, 61, 62, 63, 64), 5, 100.0) == (None, np.inf)  # no chord of that length
+
+
+def test_fallback_is_brute_force():
+    index = estimate_notes.ChordIndex(chords)
+    input_chord = (59, 61, 70)  # no chord with these pitch classes, transposed or not
+    triads = [chord for chord in chords if len(chord) == 3]
+    expected = min(triads, key=lambda chord: estimate_notes.get_weighted_distance(input_chord, chord, 100.0))
+    assert index.lookup(input_chord, 3, 100.0)[0] == expected
+
+
+def test_pickle_round_trip():
+    index = pickle.loads(pickle.dumps(estimate_notes.ChordIndex(chords)))
+    assert list(index) == chords and index.lookup((67, 60, 64), 3, 100.0)[0] == (60, 64, 67)
@@ -0,0 +1,32 @@
+from collections import Counter
+
+import numpy as np
+
+from context_trie import ContextTrie
+from markov_sequence_generator import compute_transition_chain_from_songs
+
+
+def successor_counts(trie, node):
+    return Counter({trie.chords[chord_id]: int(count)
+                    for chord_id, count in zip(node.successor_ids, np.diff(node.cumulative_counts, prepend=0))})
+
+
+def test_full_order_nodes_match_dict_model():
+    rng = np.random.default_rng(0)
+    vocab = [(60, 64, 67), (62, 65, 69), (64, 67, 71), (65, 69, 72), (67, 71, 74)]
+    songs = [[vocab[i] for i in rng.integers(len(vocab), size=40)] for _ in range(4)]
+    transition_states = compute_transition_chain_from_songs(songs, m_order=2)
+    trie = ContextTrie.from_transition_chain(transition_states)
+    for context, successors in transition_states.items():
+        node, depth = trie.longest_suffix([trie.ch2i[chord] for chord in context])
+        assert depth == 2 and node.is_context
+        assert successor_counts(trie, node) == Counter(successors)
+
+
+def test_generate_follows_known_transitions():
+    songs = [[(60, 64, 67), (62, 65, 69), (67, 71, 74), (60, 64, 67)] * 3]
+    transition_states = compute_transition_chain_from_songs(songs, m_order=2)
+    sequence = ContextTrie.from_transition_chain(transition_states).generate([(60, 64, 67)], size=8, rng=0)
+    assert len(sequence) == 8
+    for i in range(2, len(sequence)):
+        assert tuple(sequence[i]) in transition_states[tuple(map(tuple, sequence[i - 2:i]))]
@@ -0,0 +1,30 @@
+import numpy as np
+
+from context_trie import ContextTrie
+from deadline import Deadline, DeadlineStats
+from markov_sequence_generator import generate_new_sequence
+
+model = {((60,), (62,)): [(64,)], ((62,), (64,)): [(65,)], ((64,), (65,)): [(67,)], ((65,), (67,)): [(60,)],
+         ((67,), (60,)): [(62,)]}
+
+
+def test_expired_deadline_holds_last_chord():
+    for generate in (ContextTrie.from_transition_chain(model).generate,
+                     lambda *a, **k: generate_new_sequence(a[0], model, *a[1:], **k)):
+        deadline = Deadline(-1.0)
+        sequence = generate([(60,), (62,)], size=6, rng=0, deadline=deadline)
+        assert sequence == [[60], [62]] + [[62]] * 4
+        assert deadline.hit
+
+
+def test_generators_complete_before_deadline():
+    sequence = ContextTrie.from_transition_chain(model).generate([(60,), (62,)], size=6, rng=0, deadline=Deadline(60))
+    assert sequence == [[60], [62], [64], [65], [67], [60]]
+
+
+def test_late_delivery_counts_as_hit():
+    stats = DeadlineStats()
+    deadline = Deadline(-1.0)  # passed, but nothing called expired()
+    stats.record(deadline)
+    stats.record(Deadline(60))
+    assert (stats.hit, stats.met) == (1, 1)
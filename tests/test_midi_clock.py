@@ -0,0 +1,30 @@
+import mido
+import numpy as np
+
+from midi_clock import ClockFollower, ppqn
+
+
+def test_tempo_and_phase_under_jitter():
+    rng = np.random.default_rng(0)
+    follower = ClockFollower(bpm=120)
+    seconds_per_tick = 60.0 / (100 * ppqn)  # the clock runs at 100 BPM
+    follower.feed(mido.Message('start'), 10.0)
+    for tick in range(2 * 96):
+        follower.feed(mido.Message('clock'), 10.0 + tick * seconds_per_tick + rng.uniform(-0.002, 0.002))
+    assert abs(follower.bpm - 100) < 0.5
+    assert abs(follower.time_of_beat(8) - (10.0 + 8 * ppqn * seconds_per_tick)) < 0.002
+    assert abs(follower.beat_at(follower.time_of_beat(9.25)) - 9.25) < 1e-9
+
+
+def test_stop_ignores_clock_and_continue_keeps_tempo():
+    follower = ClockFollower(bpm=120)
+    seconds_per_tick = 60.0 / (90 * ppqn)
+    follower.feed(mido.Message('start'), 0.0)
+    for tick in range(48):
+        follower.feed(mido.Message('clock'), tick * seconds_per_tick)
+    follower.feed(mido.Message('stop'), 1.0)
+    follower.feed(mido.Message('clock'), 1.1)
+    assert follower.tick == 48
+    follower.feed(mido.Message('continue'), 5.0)
+    assert abs(follower.bpm - 90) < 1e-6
+    assert abs(follower.beat_at(5.0) - 2.0) < 1e-9  # resumes at the song position where it stopped
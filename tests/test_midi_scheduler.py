@@ -0,0 +1,48 @@
+import time
+
+from midi_scheduler import MidiScheduler
+
+
+class RecordingPort:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append((time.perf_counter(), message))
+
+
+def play(scheduler, end):
+    time.sleep(max(0.0, end - time.perf_counter()) + 0.05)
+    scheduler.stop(all_notes_off=False)
+
+
+def test_sequences_on_one_channel_queue_back_to_back():
+    port = RecordingPort()
+    scheduler = MidiScheduler(port, bpm=600).start()  # 0.1 s per beat
+    first = scheduler.schedule_sequence([[60, 64, 67]], chord_duration=1)
+    second = scheduler.schedule_sequence([[62, 65, 69]], chord_duration=1)
+    assert abs(second - first - 0.1) < 1e-9
+    play(scheduler, second)
+    first_off = max(t for t, m in port.messages if m.type == 'note_off' and m.note == 60)
+    second_on = min(t for t, m in port.messages if m.type == 'note_on' and m.note == 62)
+    assert second_on >= first_off
+
+
+def test_overlapping_sequences_do_not_cut_shared_notes():
+    port = RecordingPort()
+    scheduler = MidiScheduler(port, bpm=600).start()
+    start = time.perf_counter() + 0.05
+    scheduler.schedule_sequence([[60, 64]], chord_duration=1, start=start)  # ends at start + 0.1
+    end = scheduler.schedule_sequence([[60, 67]], chord_duration=2, start=start + 0.05)  # holds 60 until start + 0.25
+    play(scheduler, end)
+    offs = [t for t, m in port.messages if m.type == 'note_off' and m.note == 60]
+    assert len(offs) == 1 and offs[0] >= end - 0.001
+
+
+def test_lateness_is_sub_millisecond():
+    port = RecordingPort()
+    scheduler = MidiScheduler(port, bpm=1200).start()
+    end = scheduler.schedule_sequence([[60, 64, 67]] * 8, chord_duration=1)
+    play(scheduler, end)
+    mean, worst = scheduler.jitter()
+    assert mean < 1.0
@@ -0,0 +1,25 @@
+import pytest
+
+from markov_sequence_generator import compute_transition_chain_from_songs
+from model_pruning import held_out_log_likelihood, prune_transition_chain
+
+songs = [[(60, 64, 67), (62, 65, 69), (67, 71, 74), (60, 64, 67), (65, 69, 72)] * 2]
+
+
+def test_prune_keeps_frequent_contexts():
+    transition_states = compute_transition_chain_from_songs(songs, m_order=2)
+    pruned = prune_transition_chain(transition_states, min_count=2)
+    assert pruned and all(len(successors) >= 2 for successors in pruned.values())
+
+
+def test_pruning_everything_raises():
+    transition_states = compute_transition_chain_from_songs(songs, m_order=2)
+    with pytest.raises(ValueError, match="no context"):
+        prune_transition_chain(transition_states, min_count=100)
+    with pytest.raises(ValueError, match="no context"):
+        prune_transition_chain(transition_states, memory_budget=1)
+
+
+def test_empty_model_likelihood_raises():
+    with pytest.raises(ValueError, match="Empty"):
+        held_out_log_likelihood({}, songs)
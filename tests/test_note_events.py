@@ -0,0 +1,51 @@
+import mido
+import numpy as np
+
+from note_events import TempoMap, notes_in_window, read_midi_file
+
+
+def midi_with_tempo_changes():
+    """ Two tracks: tempo changes in the first, notes in the second (format 1, as in most files) """
+    mid = mido.MidiFile(ticks_per_beat=480)
+    mid.tracks.append(mido.MidiTrack([mido.MetaMessage('set_tempo', tempo=400000, time=240),
+                                      mido.MetaMessage('set_tempo', tempo=750000, time=960),
+                                      mido.MetaMessage('set_tempo', tempo=300000, time=500)]))
+    notes = mido.MidiTrack()
+    for pitch in (60, 64, 67, 72, 71, 69):
+        notes.append(mido.Message('note_on', note=pitch, velocity=90, time=100))
+        notes.append(mido.Message('note_off', note=pitch, velocity=0, time=400))
+    mid.tracks.append(notes)
+    return mid
+
+
+def mido_note_times(mid):
+    """ Seconds of every note message as mido plays the file """
+    seconds, times = 0.0, []
+    for msg in mid:  # msg.time: delta seconds, following the tempo changes
+        seconds += msg.time
+        if msg.type in ('note_on', 'note_off'):
+            times.append(seconds)
+    return np.array(times)
+
+
+def test_seconds_match_mido():
+    mid = midi_with_tempo_changes()
+    events, _ = read_midi_file(mid)
+    times = mido_note_times(mid)
+    np.testing.assert_allclose(np.sort(events['on']), times[0::2], atol=1e-9)
+    np.testing.assert_allclose(np.sort(events['off']), times[1::2], atol=1e-9)
+
+
+def test_seconds_to_tick_inverts_tick_to_seconds():
+    tempo_map = TempoMap(480, [(240, 400000), (1200, 750000), (1700, 300000)])
+    ticks = np.arange(0, 4000, 7)
+    np.testing.assert_allclose(tempo_map.seconds_to_tick(tempo_map.tick_to_seconds(ticks)), ticks, atol=1e-6)
+    assert tempo_map.beat_to_seconds(0.5) == 0.25  # default tempo before the first change
+
+
+def test_notes_in_window():
+    mid = midi_with_tempo_changes()
+    events, _ = read_midi_file(mid)
+    first = events[0]
+    assert notes_in_window(events, first['on'], first['off']) == [int(first['pitch'])]
+    assert notes_in_window(events, first['off'], first['off']) == []
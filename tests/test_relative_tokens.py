@@ -0,0 +1,20 @@
+from markov_sequence_generator import chord_root, relative_to_absolute, to_relative_sequence
+
+
+def test_root_of_inversions():
+    assert chord_root((60, 64, 67)) == 60
+    assert chord_root((64, 67, 72)) == 72  # first inversion of C major
+    assert chord_root((55, 60, 64)) == 60  # second inversion
+    assert chord_root((57, 60, 64)) == 57  # A minor
+
+
+def test_inversions_share_the_step():
+    root_position = to_relative_sequence([(55, 59, 62), (60, 64, 67)])
+    inversion = to_relative_sequence([(55, 59, 62), (64, 67, 72)])
+    assert root_position[1][0] == inversion[1][0] == 5
+
+
+def test_tokens_round_trip():
+    sequence = [(60, 64, 67), (65, 69, 72), (55, 59, 62), (52, 55, 60)]  # roots within a tritone of the first
+    tokens = to_relative_sequence(sequence)
+    assert relative_to_absolute(tokens, ref_anchor=chord_root(sequence[0])) == [list(chord) for chord in sequence]
@@ -0,0 +1,26 @@
+import numpy as np
+from scipy import sparse
+
+from transition_analysis import n_step_reachability
+
+
+def fan_in_matrix(width):
+    """ Chord 0 -> chords 1..width -> chord width + 1: width two-step paths into the last chord """
+    n = width + 2
+    rows = [0] * width + list(range(1, width + 1))
+    cols = list(range(1, width + 1)) + [width + 1] * width
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+
+def test_reachability_with_fan_in_above_int8():
+    P = fan_in_matrix(256)
+    reachable = n_step_reachability(P, 2, sources=[0]).toarray()
+    assert reachable[0, 257]
+    assert reachable[0].sum() == 258
+
+
+def test_reachability_respects_step_limit():
+    P = fan_in_matrix(3)
+    reachable = n_step_reachability(P, 1, sources=[0]).toarray()
+    assert not reachable[0, 4]
+    assert reachable[0, :4].all()
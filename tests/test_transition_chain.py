@@ -0,0 +1,43 @@
+from collections import Counter
+
+import numpy as np
+
+from markov_sequence_generator import (compute_relative_transition_chain, compute_transition_chain,
+                                       compute_transition_chain_from_songs)
+
+
+def random_songs(rng, n_songs=5, vocab_size=6):
+    vocab = [tuple(int(note) for note in rng.choice(np.arange(48, 72), size=3, replace=False)) for _ in range(vocab_size)]
+    return [[vocab[i] for i in rng.integers(vocab_size, size=rng.integers(1, 30))] for _ in range(n_songs)]
+
+
+def baseline(songs, m_order, chain):
+    """ The per-index chains of every song, merged """
+    merged = {}
+    for song in songs:
+        for context, successors in chain(song, m_order=m_order).items():
+            merged.setdefault(context, []).extend(successors)
+    return merged
+
+
+def as_counts(transition_states):
+    return {context: Counter(successors) for context, successors in transition_states.items()}
+
+
+def test_ngram_tables_match_baseline():
+    rng = np.random.default_rng(0)
+    for m_order in (1, 2, 4):
+        songs = random_songs(rng)
+        expected = baseline(songs, m_order, compute_transition_chain)
+        assert as_counts(compute_transition_chain_from_songs(songs, m_order=m_order)) == as_counts(expected)
+
+
+def test_relative_ngram_tables_match_baseline():
+    rng = np.random.default_rng(1)
+    songs = random_songs(rng)
+    expected = baseline(songs, 2, compute_relative_transition_chain)
+    assert as_counts(compute_transition_chain_from_songs(songs, m_order=2, relative=True)) == as_counts(expected)
+
+
+def test_songs_shorter_than_order_give_empty_model():
+    assert compute_transition_chain_from_songs([[(60, 64, 67)], [(62, 65, 69), (60, 64, 67)]], m_order=3) == {}
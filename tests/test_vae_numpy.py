@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+import vae_numpy
+
+vae = pytest.importorskip("vae", exc_type=ImportError)  # needs tensorflow/keras
+
+
+def test_numpy_decoder_matches_keras(tmp_path):
+    latent_dim, output_shape = 4, (8, 10)
+    decoder = vae.create_decoder(latent_dim, output_shape)
+    vocab = [f"C:{i}" for i in range(output_shape[1])]
+    path = str(tmp_path / "decoder.npz")
+    vae.export_decoder_npz(decoder, vocab, path=path)
+    weights = vae_numpy.load_decoder_weights(path)
+
+    z_samples = np.random.default_rng(0).normal(size=(5, latent_dim)).astype(np.float32)
+    expected = decoder.predict(z_samples, verbose=0)
+    np.testing.assert_allclose(vae_numpy.decode(z_samples, weights), expected, rtol=1e-4, atol=1e-6)
+    assert weights['vocab'] == vocab and weights['output_shape'] == output_shape
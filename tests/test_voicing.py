@@ -0,0 +1,28 @@
+import itertools
+
+import numpy as np
+
+from voicing import candidate_voicings, movement_cost, optimize_voicings
+
+
+def total_movement(voiced_sequence):
+    return sum(int(movement_cost(np.array([prev]), np.array([cur]))[0, 0])
+               for prev, cur in zip(voiced_sequence, voiced_sequence[1:]))
+
+
+def brute_force(sequence, keep_first):
+    candidates = [candidate_voicings(chord) for chord in sequence]
+    if keep_first:
+        candidates[0] = np.sort(np.asarray(sequence[0]))[None]
+    return min(total_movement([voicing.tolist() for voicing in path]) for path in itertools.product(*candidates))
+
+
+def test_dp_matches_brute_force():
+    progressions = [[(60, 64, 67), (65, 69, 72), (67, 71, 74, 77)],
+                    [(57, 60, 64), (50, 53, 57, 60), (55, 59, 62)],
+                    [(48, 52, 55, 59), (62, 65, 69), (67, 71, 74)]]
+    for sequence in progressions:
+        for keep_first in (True, False):
+            voiced = optimize_voicings(sequence, keep_first=keep_first)
+            assert [sorted(note % 12 for note in chord) for chord in voiced] == [sorted(note % 12 for note in chord) for chord in sequence]
+            assert total_movement(voiced) == brute_force(sequence, keep_first)
@@ -0,0 +1,134 @@
+import pickle
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+""" Offline analysis of the Markov model as a sparse first-order transition matrix over the chord vocabulary """
+
+
+def to_first_order_csr(transition_states):
+    """ --- Export the model to a CSR count matrix ---
+    Higher-order contexts are collapsed onto their last chord, i.e. counts[i, j] is how often chord j
+    followed chord i in the training data.
+    Returns:
+        counts (sparse.csr_matrix): shape (n_chords, n_chords)
+        chords (list[tuple]): chord id -> chord
+    """
+    ch2i = {}
+    rows, cols = [], []
+    for key, successors in transition_states.items():
+        row = ch2i.setdefault(tuple(key[-1]), len(ch2i))
+        for successor in successors:
+            rows.append(row)
+            cols.append(ch2i.setdefault(tuple(successor), len(ch2i)))
+    n = len(ch2i)
+    counts = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n)).tocsr()  # duplicates are summed
+    chords = [None] * n
+    for chord, i in ch2i.items():
+        chords[i] = chord
+    return counts, chords
+
+
+def transition_probabilities(counts):
+    """ Row-normalized transition matrix (rows of chords that never had a successor stay zero) """
+    totals = np.asarray(counts.sum(axis=1)).ravel()
+    inverse = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)
+    return sparse.diags(inverse) @ counts
+
+
+def n_step_reachability(P, n_steps, sources=None):
+    """ --- Chords reachable within n_steps transitions ---
+    Parameters:
+        P (sparse.csr_matrix): transition matrix
+        n_steps (int): maximum number of transitions
+        sources (list[int]): chord ids to start from (None: all chords)
+    Returns:
+        reachable (sparse.csr_matrix): boolean, reachable[s, j] for every source s
+    """
+    adjacency = (P > 0).astype(np.int32)  # int32: a product sums path counts, which overflow a small int type
+    n = P.shape[0]
+    sources = np.arange(n) if sources is None else np.asarray(sources)
+    reachable = sparse.csr_matrix((np.ones(len(sources), dtype=np.int32), (np.arange(len(sources)), sources)), shape=(len(sources), n))
+    frontier = reachable
+    for _ in range(n_steps):
+        frontier = ((frontier @ adjacency) > 0).astype(np.int32)
+        frontier = frontier - frontier.multiply(reachable)  # only chords not reached before
+        frontier.eliminate_zeros()
+        if frontier.nnz == 0:
+            break
+        reachable = reachable + frontier
+    return reachable > 0
+
+
+def stationary_distribution(P, damping=1.0, tol=1e-10, max_iter=1000):
+    """ --- Stationary chord distribution by power iteration ---
+    Chords without successors jump to a uniformly random chord. With damping < 1 the chain also jumps
+    uniformly with probability 1 - damping, which guarantees convergence for reducible models.
+    Returns:
+        pi (np.ndarray): probability of each chord id
+    """
+    n = P.shape[0]
+    dangling = np.asarray(P.sum(axis=1)).ravel() == 0
+    PT = P.T.tocsr()
+    pi = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        new_pi = damping * (PT @ pi + pi[dangling].sum() / n) + (1 - damping) / n
+        new_pi /= new_pi.sum()
+        if np.abs(new_pi - pi).sum() < tol:
+            return new_pi
+        pi = new_pi
+    print(f"Stationary distribution did not converge after {max_iter} iterations")
+    return pi
+
+
+def chord_entropy(P):
+    """ Entropy (bits) of the successor distribution of every chord, 0 for chords without successors """
+    plogp = sparse.csr_matrix((-P.data * np.log2(P.data), P.indices, P.indptr), shape=P.shape)
+    return np.asarray(plogp.sum(axis=1)).ravel()
+
+
+def most_likely_path(P, source, target):
+    """ --- Most likely chord path from source to target (Dijkstra on -log probabilities) ---
+    Returns:
+        path (list[int]): chord ids from source to target, empty if target is unreachable
+        probability (float): product of the transition probabilities along the path
+    """
+    P = P.tocsr()
+    weights = sparse.csr_matrix((-np.log(P.data) + 1e-12, P.indices, P.indptr), shape=P.shape)  # keep p=1 edges nonzero
+    distances, predecessors = csgraph.dijkstra(weights, indices=source, return_predecessors=True)
+    if not np.isfinite(distances[target]):
+        return [], 0.0
+    path = [target]
+    while path[-1] != source:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1], float(np.exp(-distances[target]))
+
+
+def main():
+    """ Print a summary of the trained model """
+    with open("transition_matrix.pkl", "rb") as f:
+        transition_matrix = pickle.load(f)
+
+    counts, chords = to_first_order_csr(transition_matrix)
+    P = transition_probabilities(counts)
+    print(f"{len(chords)} chords, {counts.nnz} transitions")
+
+    pi = stationary_distribution(P, damping=0.99)
+    print("Most likely chords (stationary distribution):")
+    for i in np.argsort(pi)[::-1][:10]:
+        print(f"  {chords[i]}: {pi[i]:.4f}")
+
+    entropy = chord_entropy(P)
+    print(f"Mean successor entropy: {entropy.mean():.2f} bits, most predictable chord: {chords[np.argmin(entropy)]}")
+
+    reachable = n_step_reachability(P, 4)
+    print(f"Mean number of chords reachable within 4 steps: {reachable.sum(axis=1).mean():.1f}")
+
+    source, target = int(np.argmax(pi)), int(np.argsort(pi)[-2])
+    path, probability = most_likely_path(P, source, target)
+    print(f"Most likely path {chords[source]} -> {chords[target]}: {[chords[i] for i in path]} (p={probability:.4f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,85 @@
+import os
+import pickle
+import re
+
 import jams
 import numpy as np
 import tensorflow as tf
-from keras import layers, models
+from keras import callbacks, layers, models
+
+from corpus_cache import load_progressions
+
+""" Trains a VAE on windows of chord labels from the CHoCo JAMS corpus and samples new chords from it.
+Run this file to (re)train; inference only loads the saved decoder and vocabulary. """
+
+# Settings
+latent_dim = 2
+window_size = 8  # chords per training window
+batch_size = 64
+shuffle_buffer = 10000
+checkpoint_dir = "checkpoints/vae"
+decoder_path = "vae_decoder.keras"
+decoder_npz_path = "vae_decoder.npz"
+vocab_path = "vae_vocab.pkl"
 
 
 def load_choco_jams(jams_file):
     jam = jams.load(jams_file, validate=False)
     chords = jam.annotations.search(namespace="chord")[0]
     chord_progressions = []
-    
+
     for chord in chords:
         value = chord.value
         chord_progressions.append(value)
-    
+
     return chord_progressions
 
-jams_file = "data/jams/billboard_341.jams"
-chord_progressions = load_choco_jams(jams_file)
 
+# remove 'N' chords
+def clean_chords(chord_progressions):
+    chord_progressions = [chord for chord in chord_progressions if chord != "N"]
+    return chord_progressions
 
 
-latent_dim = 2
+def load_corpus(data_path="data/jams"):
+    """ Return the cleaned chord progression of every JAMS file in data_path (one list per song),
+    read from the compiled corpus cache (see corpus_cache.py) """
+    return [clean_chords(progression) for progression in load_progressions(data_path)]
+
+
+def build_vocabulary(progressions: list[list[str]]) -> tuple[list[str], dict[str, int]]:
+    """ Sorted list of all chord labels in the corpus and the mapping label -> chord id """
+    vocab = sorted({chord for progression in progressions for chord in progression})
+    ch2i = {ch: i for i, ch in enumerate(vocab)}
+    return vocab, ch2i
+
+
+def make_windows(progressions: list[list[str]], ch2i: dict[str, int], size: int = window_size) -> np.ndarray:
+    """ --- Cut every song into overlapping windows of chord ids ---
+    Windows never span two songs; songs shorter than size are skipped.
+    Returns:
+        windows (np.ndarray): int32 array of shape (n_windows, size)
+    """
+    windows = []
+    for progression in progressions:
+        if len(progression) < size:
+            continue
+        ids = np.array([ch2i[ch] for ch in progression], dtype=np.int32)
+        windows.append(np.lib.stride_tricks.sliding_window_view(ids, size))
+    if not windows:
+        return np.empty((0, size), dtype=np.int32)
+    return np.concatenate(windows)
+
+
+def make_dataset(windows: np.ndarray, vocab_size: int, batch_size: int = batch_size, shuffle: bool = True):
+    """ tf.data pipeline: shuffled batches of chord-id windows, one-hot encoded on the fly and prefetched """
+    dataset = tf.data.Dataset.from_tensor_slices(windows)
+    if shuffle:
+        dataset = dataset.shuffle(min(shuffle_buffer, len(windows)), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(lambda x: tf.one_hot(x, vocab_size), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
 
 # Encoder
 def create_encoder(input_shape, latent_dim):
@@ -32,12 +91,13 @@ def create_encoder(input_shape, latent_dim):
     encoder = models.Model(inputs, [z_mean, z_log_var])
     return encoder
 
-# Decoder
+# Decoder: one softmax over the chord vocabulary per window position
 def create_decoder(latent_dim, output_shape):
     latent_inputs = layers.Input(shape=(latent_dim,))
     x = layers.Dense(128, activation='relu')(latent_inputs)
-    x = layers.Dense(np.prod(output_shape), activation='sigmoid')(x)
-    outputs = layers.Reshape(output_shape)(x)
+    x = layers.Dense(np.prod(output_shape))(x)
+    x = layers.Reshape(output_shape)(x)
+    outputs = layers.Softmax(axis=-1)(x)
     decoder = models.Model(latent_inputs, outputs)
     return decoder
 
@@ -54,60 +114,121 @@ class Sampling(layers.Layer):
 def create_vae(input_shape, latent_dim):
     encoder = create_encoder(input_shape, latent_dim)
     decoder = create_decoder(latent_dim, input_shape)
-    
+
     inputs = layers.Input(shape=input_shape)
     z_mean, z_log_var = encoder(inputs)
     z = Sampling()([z_mean, z_log_var])
     outputs = decoder(z)
-    
+
     vae = models.Model(inputs, outputs)
-    
-    # loss
-    reconstruction_loss = tf.keras.losses.binary_crossentropy(inputs, outputs)
-    reconstruction_loss *= np.prod(input_shape)
+
+    # loss: categorical cross-entropy summed over the window positions
+    reconstruction_loss = tf.keras.losses.categorical_crossentropy(inputs, outputs)
+    reconstruction_loss = tf.reduce_sum(reconstruction_loss, axis=-1)
     kl_loss = 1 + z_log_var - tf.square(z_mean) - tf.exp(z_log_var)
-    kl_loss = tf.reduce_mean(kl_loss, axis=-1)
+    kl_loss = tf.reduce_sum(kl_loss, axis=-1)
     kl_loss *= -0.5
     vae_loss = tf.reduce_mean(reconstruction_loss + kl_loss)
-    
+
     vae.add_loss(vae_loss)
     vae.compile(optimizer='adam')
-    
+
     return vae, encoder, decoder
 
-# remove 'N' chords 
-def clean_chords(chord_progressions):
-    chord_progressions = [chord for chord in chord_progressions if chord != "N"]  
-    return chord_progressions
-chord_progressions = clean_chords(chord_progressions)
 
-# Define input shape based on chord progression data
-input_shape = (len(chord_progressions), 1)  # e.g. (87, 1)
-vae, encoder, decoder = create_vae(input_shape, latent_dim)
+def latest_epoch(checkpoint_dir=checkpoint_dir):
+    """ Return (checkpoint path, epoch) of the newest checkpoint, or (None, 0) """
+    checkpoint = tf.train.latest_checkpoint(checkpoint_dir)
+    if checkpoint is None:
+        return None, 0
+    return checkpoint, int(re.search(r'ckpt-(\d+)', checkpoint).group(1))
+
+
+def train_vae(data_path="data/jams", epochs=50, resume=True):
+    """ --- Train the VAE on the whole JAMS corpus ---
+    Saves a weights checkpoint after every epoch (training resumes from the newest one),
+    and finally the trained decoder and the chord vocabulary for inference.
+    Returns:
+        vae, encoder, decoder, vocab
+    """
+    progressions = load_corpus(data_path)
+    vocab, ch2i = build_vocabulary(progressions)
+    windows = make_windows(progressions, ch2i)
+    print(f"{len(progressions)} songs, {len(vocab)} chords, {len(windows)} windows of {window_size} chords")
+
+    dataset = make_dataset(windows, len(vocab))
+    vae, encoder, decoder = create_vae((window_size, len(vocab)), latent_dim)
+
+    initial_epoch = 0
+    if resume:
+        checkpoint, initial_epoch = latest_epoch()
+        if checkpoint:
+            print(f"Resuming from {checkpoint}")
+            vae.load_weights(checkpoint)
 
-print("############ Encoder summary ############")
-encoder.summary()
-print("############ Decoder summary ############")
-decoder.summary()
-print("############ VAE summary ############")
-vae.summary()
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    save_checkpoint = callbacks.ModelCheckpoint(os.path.join(checkpoint_dir, "ckpt-{epoch:04d}"), save_weights_only=True)
+    vae.fit(dataset, epochs=epochs, initial_epoch=initial_epoch, callbacks=[save_checkpoint], verbose=2)
 
+    decoder.save(decoder_path)
+    with open(vocab_path, 'wb') as f:
+        pickle.dump({'vocab': vocab, 'window_size': window_size, 'latent_dim': latent_dim}, f)
+    print(f"Saved decoder to {decoder_path} and vocabulary to {vocab_path}")
 
-# Convert data to numpy array
-chord_progressions = np.array([str(ch) for ch in chord_progressions]).reshape(-1, 1)
+    return vae, encoder, decoder, vocab
 
-# Normalize the data
-#chord_progressions = (chord_progressions - np.min(chord_progressions)) / (np.max(chord_progressions) - np.min(chord_progressions))
 
+def load_decoder(path=decoder_path, vocab_file=vocab_path):
+    """ Load the trained decoder and its vocabulary (no training) """
+    decoder = models.load_model(path, compile=False)
+    with open(vocab_file, 'rb') as f:
+        vocab = pickle.load(f)['vocab']
+    return decoder, vocab
 
-# Train VAE
-vae.fit(chord_progressions, chord_progressions, epochs=50, batch_size=32, verbose=2)
 
 # Generate new chords by sampling from the latent space
-def generate_chords(decoder, num_samples=10):
-    z_samples = np.random.normal(size=(num_samples, latent_dim))
-    generated_chords = decoder.predict(z_samples)
+def generate_chords(decoder, num_samples=10, rng=None):
+    z_samples = np.random.default_rng(rng).normal(size=(num_samples, latent_dim))
+    generated_chords = decoder.predict(z_samples, verbose=0)
     return generated_chords
 
-new_chords = generate_chords(decoder, num_samples=10)
-print(new_chords)
+
+def decode_chords(generated_chords, vocab):
+    """ Map decoder output (num_samples, window_size, vocab_size) to lists of chord labels """
+    ids = np.argmax(generated_chords, axis=-1)
+    return [[vocab[i] for i in row] for row in ids]
+
+
+def export_decoder_npz(decoder, vocab, path=decoder_npz_path):
+    """ --- Dump the decoder's dense weights to an .npz for the TensorFlow-free decoder in vae_numpy.py ---
+    Stores kernel_i, bias_i and the activation of every Dense layer in order, the output shape
+    (window_size, vocab_size) that is reshaped and softmaxed, and the chord vocabulary.
+    """
+    dense_layers = [layer for layer in decoder.layers if isinstance(layer, layers.Dense)]
+    arrays = {}
+    for i, layer in enumerate(dense_layers):
+        kernel, bias = layer.get_weights()
+        arrays[f'kernel_{i}'] = kernel.astype(np.float32)
+        arrays[f'bias_{i}'] = bias.astype(np.float32)
+    arrays['activations'] = np.array([layer.get_config()['activation'] for layer in dense_layers])
+    arrays['output_shape'] = np.array(decoder.output_shape[1:], dtype=np.int64)
+    arrays['vocab'] = np.array(vocab)
+    np.savez(path, **arrays)
+    print(f"Exported decoder weights to {path}")
+
+
+def main():
+    _, encoder, decoder, vocab = train_vae()
+    export_decoder_npz(decoder, vocab)
+
+    print("############ Encoder summary ############")
+    encoder.summary()
+    print("############ Decoder summary ############")
+    decoder.summary()
+
+    new_chords = decode_chords(generate_chords(decoder, num_samples=10), vocab)
+    print(new_chords)
+
+
+if __name__ == "__main__":
+    main()
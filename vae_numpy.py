@@ -0,0 +1,46 @@
+import numpy as np
+
+""" TensorFlow-free forward pass of the VAE decoder, using the weights exported by vae.export_decoder_npz() """
+
+activations = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+}
+
+
+def load_decoder_weights(path="vae_decoder.npz") -> dict:
+    """ Load the exported decoder: dense layers as (kernel, bias, activation), output shape and vocabulary """
+    with np.load(path) as data:
+        dense_layers = [(data[f'kernel_{i}'], data[f'bias_{i}'], str(activation))
+                        for i, activation in enumerate(data['activations'])]
+        return {
+            'layers': dense_layers,
+            'output_shape': tuple(int(n) for n in data['output_shape']),
+            'vocab': [str(ch) for ch in data['vocab']],
+        }
+
+
+def decode(z_samples, weights) -> np.ndarray:
+    """ --- Decode a batch of latent samples ---
+    Parameters:
+        z_samples (np.ndarray): latent vectors, shape (num_samples, latent_dim)
+        weights (dict): decoder from load_decoder_weights()
+    Returns:
+        probabilities (np.ndarray): softmax over the vocabulary, shape (num_samples, window_size, vocab_size)
+    """
+    x = np.asarray(z_samples, dtype=np.float32)
+    for kernel, bias, activation in weights['layers']:
+        x = activations[activation](x @ kernel + bias)
+    x = x.reshape((len(x),) + weights['output_shape'])
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    return x / x.sum(axis=-1, keepdims=True)
+
+
+def generate_chords(weights, num_samples=10, rng=None):
+    """ Sample latent vectors and return the decoded chord labels, one list of window_size chords per sample """
+    latent_dim = weights['layers'][0][0].shape[0]
+    z_samples = np.random.default_rng(rng).normal(size=(num_samples, latent_dim))
+    ids = np.argmax(decode(z_samples, weights), axis=-1)
+    return [[weights['vocab'][i] for i in row] for row in ids]
@@ -0,0 +1,83 @@
+from functools import lru_cache
+
+import numpy as np
+
+""" Post-processing of generated progressions: re-voices every chord (inversion and octave) so that
+the total voice movement across the whole sequence is minimal. """
+
+# Range the voicings may use (MIDI notes)
+low_note = 48
+high_note = 84
+
+
+@lru_cache(maxsize=4096)
+def _candidate_voicings(chord, low, high):
+    return candidate_voicings(chord, low, high)
+
+
+def candidate_voicings(chord, low=low_note, high=high_note):
+    """ --- Enumerate inversions and octave placements of a chord ---
+    Every inversion is built by moving the lowest notes up an octave, then shifted by whole octaves
+    while it fits into [low, high]. The chord's own voicing is always included.
+    Returns:
+        voicings (np.ndarray): shape (n_voicings, n_notes), notes sorted ascending
+    """
+    notes = np.sort(np.asarray(chord, dtype=np.int64))
+    n = len(notes)
+    inversions = np.array([np.concatenate([notes[i:], notes[:i] + 12]) for i in range(n)])
+    shifts = np.arange(-4, 5) * 12
+    voicings = np.sort((inversions[:, None, :] + shifts[None, :, None]).reshape(-1, n), axis=1)
+    in_range = (voicings.min(axis=1) >= low) & (voicings.max(axis=1) <= high)
+    voicings = np.unique(np.vstack([voicings[in_range], notes[None]]), axis=0)
+    return voicings
+
+
+def movement_cost(prev_voicings, voicings):
+    """ --- Voice movement between all pairs of voicings of two consecutive chords ---
+    Voices are matched by rank (lowest to lowest, ...); when the chords differ in size, the extra
+    notes of the larger chord are matched to the nearest note of the smaller one.
+    Returns:
+        cost (np.ndarray): shape (n_prev, n_cur), total semitones moved
+    """
+    n_prev, n_cur = prev_voicings.shape[1], voicings.shape[1]
+    n = min(n_prev, n_cur)
+    cost = np.abs(prev_voicings[:, None, :n] - voicings[None, :, :n]).sum(axis=2)
+    if n_prev > n:
+        extra = np.abs(prev_voicings[:, None, n:, None] - voicings[None, :, None, :]).min(axis=3)
+        cost += extra.sum(axis=2)
+    elif n_cur > n:
+        extra = np.abs(voicings[None, :, n:, None] - prev_voicings[:, None, None, :]).min(axis=3)
+        cost += extra.sum(axis=2)
+    return cost
+
+
+def optimize_voicings(sequence, low=low_note, high=high_note, keep_first=True):
+    """ --- Minimum-total-movement voicing of a whole progression (dynamic programming / Viterbi) ---
+    Parameters:
+        sequence (list[list[int]]): chords as MIDI notes, e.g. from generate_new_sequence()
+        low, high (int): MIDI range of the voicings
+        keep_first (bool): keep the first chord as voiced (e.g. the chord the musician played)
+    Returns:
+        voiced_sequence (list[list[int]]): same chords, re-voiced
+    """
+    if not sequence:
+        return []
+    candidates = [_candidate_voicings(tuple(chord), low, high) for chord in sequence]
+    if keep_first:
+        candidates[0] = np.sort(np.asarray(sequence[0], dtype=np.int64))[None]
+
+    # forward pass: cheapest total movement to reach every voicing of chord i, and where it came from
+    total = np.zeros(len(candidates[0]))
+    back_pointers = []
+    for prev_voicings, voicings in zip(candidates, candidates[1:]):
+        step = total[:, None] + movement_cost(prev_voicings, voicings)
+        back_pointers.append(np.argmin(step, axis=0))
+        total = step.min(axis=0)
+
+    # backtrack the cheapest path
+    best = [int(np.argmin(total))]
+    for pointers in reversed(back_pointers):
+        best.append(int(pointers[best[-1]]))
+    best.reverse()
+
+    return [candidates[i][j].tolist() for i, j in enumerate(best)]